@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark: overhead per insight del processing worker.
+
+Confronta la vecchia strategia (nuovo event loop + nuovo httpx.AsyncClient per ogni
+insight) con quella attuale (loop persistente + client condiviso). Ogni "insight"
+scarica un piccolo media da un server HTTP locale keep-alive, così la misura
+include setup del loop e apertura delle connessioni ma non la latenza di rete reale.
+
+Uso: python scripts/bench_worker_loop.py [--n 300]
+"""
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+PAYLOAD = b"x" * 2048
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_server() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/media"
+
+
+def bench_loop_per_insight(url: str, n: int) -> list:
+    async def handle():
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            r = await client.get(url)
+            r.raise_for_status()
+
+    timings = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(handle())
+        finally:
+            loop.close()
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+
+def bench_persistent_loop(url: str, n: int) -> list:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    client = asyncio.run_coroutine_threadsafe(_make_client(), loop).result()
+
+    async def handle():
+        r = await client.get(url)
+        r.raise_for_status()
+
+    timings = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        asyncio.run_coroutine_threadsafe(handle(), loop).result()
+        timings.append(time.perf_counter() - t0)
+    asyncio.run_coroutine_threadsafe(client.aclose(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    return timings
+
+
+async def _make_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=30.0)
+
+
+def _report(name: str, timings: list):
+    ms = sorted(t * 1000 for t in timings)
+    p95 = ms[int(len(ms) * 0.95) - 1]
+    print(f"{name:<28} mean {statistics.mean(ms):7.3f} ms   p50 {statistics.median(ms):7.3f} ms   p95 {p95:7.3f} ms")
+    return statistics.mean(ms)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=300)
+    args = parser.parse_args()
+
+    url = _start_server()
+    # warm-up
+    bench_loop_per_insight(url, 10)
+    bench_persistent_loop(url, 10)
+
+    before = _report("loop + client per insight", bench_loop_per_insight(url, args.n))
+    after = _report("persistent loop + pool", bench_persistent_loop(url, args.n))
+    print(f"overhead saved per insight: {before - after:.3f} ms ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
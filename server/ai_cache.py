@@ -0,0 +1,141 @@
+"""
+Result cache for LLM calls (sentiment, OCR enhancement) keyed on normalized text.
+
+Two levels: an in-process LRU answers repeated inputs in microseconds, the
+ai_result_cache table shares results across worker processes and replicas.
+Entries expire after AI_CACHE_TTL_SECONDS; the table is pruned to AI_CACHE_MAX_ROWS
+least recently used rows.
+"""
+
+import hashlib
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Any, Dict
+
+from sqlalchemy import delete, select, func
+
+from .config import settings
+from .db import SessionLocal
+from .models import AIResultCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(kind: str, model: str, prompt_version: str, text: str, casefold: bool = False) -> str:
+    normalized = " ".join(text.split())
+    if casefold:
+        normalized = normalized.casefold()
+    return hashlib.sha256(f"{kind}\x00{model}\x00{prompt_version}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite returns naive datetimes: they are stored in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class AIResultCache:
+    def __init__(self, ttl_seconds: int, max_rows: int, local_max_items: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self.local_max_items = local_max_items
+        self._local: "OrderedDict[str, Any]" = OrderedDict()  # key -> (expires_monotonic, value)
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        self.stats = {"local_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+
+    def _remember(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_max_items:
+                self._local.popitem(last=False)
+
+    def get_local(self, key: str) -> Optional[Any]:
+        """In-process lookup only (never blocks)"""
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            self.stats["local_hits"] += 1
+            return value
+
+    def get(self, key: str) -> Optional[Any]:
+        """In-process lookup, then the shared table (blocking: call from a thread)"""
+        value = self.get_local(key)
+        if value is not None:
+            return value
+        session = SessionLocal()
+        try:
+            row = session.get(AIResultCacheEntry, key)
+            now = _utcnow()
+            if row is None or _aware(row.expires_at) < now:
+                self.stats["misses"] += 1
+                return None
+            row.last_used_at = now
+            session.commit()
+            remaining = (_aware(row.expires_at) - now).total_seconds()
+            self._remember(key, row.value, remaining)
+            self.stats["db_hits"] += 1
+            return row.value
+        except Exception as e:
+            logger.warning(f"AI cache lookup failed: {e}")
+            return None
+        finally:
+            session.close()
+
+    def put(self, key: str, kind: str, value: Any) -> None:
+        """Store in both levels (blocking: call from a thread)"""
+        self._remember(key, value, self.ttl_seconds)
+        session = SessionLocal()
+        try:
+            now = _utcnow()
+            session.merge(AIResultCacheEntry(
+                key=key,
+                kind=kind,
+                value=value,
+                expires_at=now + timedelta(seconds=self.ttl_seconds),
+                last_used_at=now,
+            ))
+            session.commit()
+            self.stats["stores"] += 1
+            self._puts_since_prune += 1
+            if self._puts_since_prune >= 500:
+                self._puts_since_prune = 0
+                self._prune(session)
+        except Exception as e:
+            logger.warning(f"AI cache store failed: {e}")
+        finally:
+            session.close()
+
+    def _prune(self, session) -> None:
+        session.execute(delete(AIResultCacheEntry).where(AIResultCacheEntry.expires_at < _utcnow()))
+        excess = session.scalar(select(func.count()).select_from(AIResultCacheEntry)) - self.max_rows
+        if excess > 0:
+            oldest = select(AIResultCacheEntry.key).order_by(AIResultCacheEntry.last_used_at).limit(excess)
+            session.execute(delete(AIResultCacheEntry).where(AIResultCacheEntry.key.in_(oldest)))
+        session.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, localItems=len(self._local))
+
+
+ai_cache: Optional[AIResultCache] = (
+    AIResultCache(settings.AI_CACHE_TTL_SECONDS, settings.AI_CACHE_MAX_ROWS, settings.AI_CACHE_LOCAL_MAX_ITEMS)
+    if settings.AI_CACHE_ENABLED else None
+)
+
+
+def get_ai_cache_stats() -> Dict[str, Any]:
+    return ai_cache.get_stats() if ai_cache else {"enabled": False}
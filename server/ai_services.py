@@ -4,15 +4,25 @@ Handles OCR, Audio Transcription, Sentiment Analysis, and LLM Q&A
 """
 
 import os
+import re
+import json
+import shutil
+import hashlib
+import asyncio
+import functools
+import contextlib
+import time
 import tempfile
+import weakref
+import threading
 import httpx
-from typing import Optional, Dict, Any, List
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable, TypeVar, AsyncIterator, Set
 from pathlib import Path
 import logging
 
-from openai import OpenAI
-from PIL import Image
-import pytesseract
+from openai import OpenAI, AsyncOpenAI
 from textblob import TextBlob
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
@@ -21,19 +31,418 @@ import chromadb
 from chromadb.config import Settings as ChromaSettings
 
 from .config import settings
+from .ocr_engine import run_ocr, preprocess_options
+from .media_cache import media_cache
+from .ai_cache import ai_cache, make_key
+from .qa_cache import qa_cache, qa_scope
+from .rate_governor import governor
+from .audio_pipeline import ffmpeg_available, normalize_and_split, transcribe_chunks
 
 logger = logging.getLogger(__name__)
 
 # Initialize OpenAI client
 openai_client = None
 if settings.OPENAI_API_KEY:
-    openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    # retries are handled by the rate governor, not by the SDK
+    openai_client = OpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+
+T = TypeVar("T")
+
+# Shared async clients, one per event loop (connections are loop-bound: the API
+# loop and the processing loop each get their own pool)
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_async_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+# Thread pool for the SDKs that only have a blocking API (Chroma, LangChain embeddings)
+_blocking_executor = ThreadPoolExecutor(max_workers=settings.AI_BLOCKING_THREADS, thread_name_prefix="ai-blocking")
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Pooled HTTP client for the running event loop, reused across calls
+    """
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+        )
+        timeout = httpx.Timeout(30.0, connect=10.0)
+        try:
+            client = httpx.AsyncClient(http2=settings.HTTP2_ENABLED, limits=limits, timeout=timeout)
+        except ImportError:
+            # h2 not installed: HTTP/1.1 keep-alive pool
+            client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        _http_clients[loop] = client
+    return client
+
+
+class FetchedMedia:
+    """
+    Downloaded media body: kept in memory when small, spooled to a temp file when large
+    """
+    
+    def __init__(self, data: Optional[bytes], path: Optional[str], size: int, sha256: str, suffix: str):
+        self.data = data
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.suffix = suffix
+    
+    def write_to(self, dest: str) -> str:
+        """Materialize the body at dest (for tools that need a file) and return it"""
+        if self.path:
+            shutil.move(self.path, dest)
+            self.path = dest
+        else:
+            with open(dest, "wb") as f:
+                f.write(self.data)
+        return dest
+    
+    def cleanup(self) -> None:
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+async def fetch_media(url: str) -> FetchedMedia:
+    """
+    Stream a media URL with the shared client. Bodies up to MEDIA_IN_MEMORY_MAX_BYTES
+    stay in memory, larger ones go to disk chunk by chunk; anything above
+    MEDIA_MAX_BYTES is rejected, so peak memory does not grow with upload size.
+    """
+    suffix = Path(httpx.URL(url).path).suffix
+    digest = hashlib.sha256()
+    buf = bytearray()
+    spool = None
+    size = 0
+    try:
+        async with get_http_client().stream("GET", url) as response:
+            response.raise_for_status()
+            declared = int(response.headers.get("content-length") or 0)
+            if declared > settings.MEDIA_MAX_BYTES:
+                raise ValueError(f"media too large: {declared} bytes")
+            async for chunk in response.aiter_bytes(64 * 1024):
+                size += len(chunk)
+                if size > settings.MEDIA_MAX_BYTES:
+                    raise ValueError(f"media too large: over {settings.MEDIA_MAX_BYTES} bytes")
+                digest.update(chunk)
+                if spool is None and size > settings.MEDIA_IN_MEMORY_MAX_BYTES:
+                    spool = tempfile.NamedTemporaryFile(prefix="media-", suffix=suffix, delete=False)
+                    spool.write(buf)
+                    buf = None
+                if spool is not None:
+                    spool.write(chunk)
+                else:
+                    buf.extend(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.unlink(spool.name)
+        raise
+    if spool is not None:
+        spool.close()
+        return FetchedMedia(None, spool.name, size, digest.hexdigest(), suffix)
+    return FetchedMedia(bytes(buf), None, size, digest.hexdigest(), suffix)
+
+
+def get_async_openai() -> Optional[AsyncOpenAI]:
+    """
+    Async OpenAI client for the running event loop (None if no API key)
+    """
+    if not settings.OPENAI_API_KEY:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _async_openai_clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+        _async_openai_clients[loop] = client
+    return client
+
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run a blocking SDK call on the AI thread pool without stalling the event loop
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, functools.partial(fn, *args, **kwargs))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+class Route:
+    """Model and output budget chosen for one task / input-size bucket"""
+    
+    def __init__(self, task: str, label: str, model: str, max_tokens: int):
+        self.task = task
+        self.label = label
+        self.model = model
+        self.max_tokens = max_tokens
+
+
+# task -> buckets ordered by input size; maxChars None = no upper bound.
+# model None = settings.OPENAI_MODEL. Override with OPENAI_ROUTES (same JSON shape).
+DEFAULT_ROUTES: Dict[str, List[Dict[str, Any]]] = {
+    "ocr_enhance": [
+        {"maxChars": 300, "model": None, "maxTokens": 150},
+        {"maxChars": 1500, "model": None, "maxTokens": 500},
+        {"maxChars": None, "model": None, "maxTokens": 1000},
+    ],
+    "sentiment": [
+        {"maxChars": None, "model": None, "maxTokens": 200},
+    ],
+    "qa": [
+        {"maxChars": 4000, "model": None, "maxTokens": 500},
+        {"maxChars": None, "model": None, "maxTokens": 700},
+    ],
+    "summarize": [
+        {"maxChars": 4000, "model": None, "maxTokens": 400},
+        {"maxChars": None, "model": None, "maxTokens": 800},
+    ],
+}
+
+
+def _load_routes() -> Dict[str, List[Dict[str, Any]]]:
+    routes = {task: list(buckets) for task, buckets in DEFAULT_ROUTES.items()}
+    if settings.OPENAI_ROUTES:
+        try:
+            routes.update(json.loads(settings.OPENAI_ROUTES))
+        except ValueError as e:
+            logger.error(f"Invalid OPENAI_ROUTES, using defaults: {e}")
+    return routes
+
+
+ROUTES = _load_routes()
+
+# (task, bucket) -> calls, latency and token usage, to tune cost/latency per route
+ROUTE_STATS: Dict[str, Dict[str, Any]] = {}
+
+
+def route_for(task: str, text: str) -> Route:
+    """Pick model and max_tokens for a task from the size of its input"""
+    size = len(text)
+    buckets = ROUTES.get(task) or [{"maxChars": None, "model": None, "maxTokens": 500}]
+    for bucket in buckets:
+        limit = bucket.get("maxChars")
+        if limit is None or size <= limit:
+            break
+    label = f"{task}:<={limit}" if limit is not None else f"{task}:*"
+    return Route(task, label, bucket.get("model") or settings.OPENAI_MODEL, int(bucket.get("maxTokens") or 500))
+
+
+def _record_route(route: Route, elapsed: float, response: Any) -> None:
+    stats = ROUTE_STATS.setdefault(route.label, {
+        "model": route.model, "calls": 0, "latency_s_total": 0.0, "prompt_tokens": 0, "completion_tokens": 0
+    })
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    stats["calls"] += 1
+    stats["latency_s_total"] = round(stats["latency_s_total"] + elapsed, 3)
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += completion_tokens
+    logger.info(
+        f"OpenAI route {route.label} model={route.model} latency={elapsed:.2f}s "
+        f"tokens={prompt_tokens}+{completion_tokens}"
+    )
+
+
+def get_route_stats() -> Dict[str, Any]:
+    result = {}
+    for label, stats in ROUTE_STATS.items():
+        calls = stats["calls"] or 1
+        result[label] = dict(stats, latency_s_avg=round(stats["latency_s_total"] / calls, 3))
+    return result
+
+
+async def _chat_completion(aclient: AsyncOpenAI, route: Route, **kwargs):
+    """
+    chat.completions.create on the routed model, under the shared RPM/TPM governor
+    with backoff on 429/5xx. max_tokens defaults to the route's budget.
+    """
+    kwargs["model"] = route.model
+    kwargs.setdefault("max_tokens", route.max_tokens)
+    est_tokens = sum(estimate_tokens(m["content"]) for m in kwargs["messages"]) + kwargs["max_tokens"]
+    started = time.monotonic()
+    response = await governor.call(lambda: aclient.chat.completions.create(**kwargs), est_tokens=est_tokens)
+    _record_route(route, time.monotonic() - started, response)
+    return response
+
+
+async def _chat_completion_stream(aclient: AsyncOpenAI, route: Route, **kwargs) -> AsyncIterator[str]:
+    """
+    Streaming chat completion on the routed model: yields content deltas as they arrive.
+    Only opening the stream is retried; usage comes from the final chunk. If the consumer
+    stops early (client disconnected) the HTTP stream is closed right away and the
+    reservation stays at the estimate, since no usage was reported.
+    """
+    kwargs["model"] = route.model
+    kwargs.setdefault("max_tokens", route.max_tokens)
+    est_tokens = sum(estimate_tokens(m["content"]) for m in kwargs["messages"]) + kwargs["max_tokens"]
+    started = time.monotonic()
+    stream = await governor.call(
+        lambda: aclient.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs),
+        est_tokens=est_tokens,
+    )
+    last = None
+    try:
+        async for chunk in stream:
+            last = chunk
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.close()
+        governor.settle(est_tokens, last)
+        _record_route(route, time.monotonic() - started, last)
+
+
+def _chat_completion_blocking(client: OpenAI, route: Route, **kwargs):
+    kwargs["model"] = route.model
+    kwargs.setdefault("max_tokens", route.max_tokens)
+    est_tokens = sum(estimate_tokens(m["content"]) for m in kwargs["messages"]) + kwargs["max_tokens"]
+    started = time.monotonic()
+    response = governor.call_blocking(lambda: client.chat.completions.create(**kwargs), est_tokens=est_tokens)
+    _record_route(route, time.monotonic() - started, response)
+    return response
+
+
+# Query embeddings repeat a lot (same questions, same filters): keep them in-process.
+_query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+EMBEDDING_STATS: Dict[str, int] = {"query_cache_hits": 0, "query_calls": 0, "document_calls": 0, "documents": 0}
+
+
+async def embed_query_cached(query: str) -> List[float]:
+    """Query embedding from the LRU (normalized text + model), else one governed API call"""
+    key = make_key("query_embedding", settings.OPENAI_EMBEDDING_MODEL, "v1", query, casefold=True)
+    with _query_embeddings_lock:
+        vector = _query_embeddings.get(key)
+        if vector is not None:
+            _query_embeddings.move_to_end(key)
+            EMBEDDING_STATS["query_cache_hits"] += 1
+            return vector
+    aclient = get_async_openai()
+    response = await governor.call(
+        lambda: aclient.embeddings.create(model=settings.OPENAI_EMBEDDING_MODEL, input=[query]),
+        est_tokens=estimate_tokens(query),
+    )
+    vector = response.data[0].embedding
+    with _query_embeddings_lock:
+        EMBEDDING_STATS["query_calls"] += 1
+        _query_embeddings[key] = vector
+        while len(_query_embeddings) > settings.EMBEDDING_CACHE_MAX_ITEMS:
+            _query_embeddings.popitem(last=False)
+    return vector
+
+
+def _embedding_batches(texts: List[str]) -> List[List[str]]:
+    """Split texts into requests within the API limits on inputs and tokens per call"""
+    batches, current, tokens = [], [], 0
+    for text in texts:
+        cost = estimate_tokens(text)
+        if current and (len(current) >= settings.EMBEDDING_BATCH_MAX_ITEMS
+                        or tokens + cost > settings.EMBEDDING_BATCH_MAX_TOKENS):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(text)
+        tokens += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def embed_documents_batched(texts: List[str]) -> List[List[float]]:
+    """Embed many chunks with as few governed API calls as the limits allow (blocking)"""
+    vectors: List[List[float]] = []
+    for batch in _embedding_batches(texts):
+        response = governor.call_blocking(
+            lambda: openai_client.embeddings.create(model=settings.OPENAI_EMBEDDING_MODEL, input=batch),
+            est_tokens=sum(estimate_tokens(t) for t in batch),
+        )
+        # the API may return items out of order: index is authoritative
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        EMBEDDING_STATS["document_calls"] += 1
+        EMBEDDING_STATS["documents"] += len(batch)
+    return vectors
+
+
+def get_embedding_stats() -> Dict[str, Any]:
+    return dict(EMBEDDING_STATS, cachedQueries=len(_query_embeddings), model=settings.OPENAI_EMBEDDING_MODEL)
+
+
+# Bump when a prompt changes: cached results from the old prompt stop matching
+SENTIMENT_PROMPT_VERSION = "sentiment-v1"
+OCR_ENHANCE_PROMPT_VERSION = "ocr-enhance-v1"
+
+
+async def _cached_result(key: str) -> Optional[Any]:
+    if not ai_cache:
+        return None
+    value = ai_cache.get_local(key)
+    if value is not None:
+        return value
+    return await run_blocking(ai_cache.get, key)
+
+
+async def _store_result(key: str, kind: str, value: Any) -> None:
+    if ai_cache and value:
+        await run_blocking(ai_cache.put, key, kind, value)
 
 # Initialize ChromaDB for Q&A RAG
 chroma_client = None
 collection = None
 embeddings = None
 
+# Collection created before report chunks were embedded with OpenAI (Chroma's local 384-dim model)
+LEGACY_RAG_COLLECTION = "field_insights_reports"
+
+
+def rag_collection_name() -> str:
+    """
+    One collection per embedding model: Chroma rejects vectors whose size differs from
+    the ones already stored, so a model change starts from an empty, consistent collection
+    """
+    slug = re.sub(r"[^a-zA-Z0-9_-]", "-", settings.OPENAI_EMBEDDING_MODEL)
+    return f"{LEGACY_RAG_COLLECTION}__{slug}"[:63].rstrip("-_")
+
+
+def _open_rag_collection():
+    return chroma_client.get_or_create_collection(
+        name=rag_collection_name(),
+        metadata={
+            "description": "Field insights reports and summaries",
+            "embedding_model": settings.OPENAI_EMBEDDING_MODEL
+        }
+    )
+
+
+def recreate_rag_collection():
+    """Drop and recreate the collection of the current embedding model (full rebuild)"""
+    global collection
+    try:
+        chroma_client.delete_collection(rag_collection_name())
+    except Exception:
+        pass  # did not exist yet
+    collection = _open_rag_collection()
+    return collection
+
+
+def _rag_call(method: str, **kwargs):
+    """
+    collection.<method>(**kwargs). If `reindex --recreate` dropped the collection from
+    another process our handle is stale: reopen it by name once and retry
+    """
+    global collection
+    try:
+        return getattr(collection, method)(**kwargs)
+    except Exception as e:
+        logger.warning(f"RAG collection {method} failed ({e}), reopening {rag_collection_name()}")
+        collection = _open_rag_collection()
+        return getattr(collection, method)(**kwargs)
+
 def init_ai_services():
     """Initialize AI services and ChromaDB"""
     global chroma_client, collection, embeddings
@@ -54,16 +463,20 @@ def init_ai_services():
             settings=ChromaSettings(anonymized_telemetry=False)
         )
         
-        # Get or create collection for reports
-        collection = chroma_client.get_or_create_collection(
-            name="field_insights_reports",
-            metadata={"description": "Field insights reports and summaries"}
-        )
+        # Get or create collection for reports (named after the embedding model)
+        collection = _open_rag_collection()
+        if collection.count() == 0:
+            legacy = [c for c in chroma_client.list_collections() if getattr(c, "name", c) != collection.name]
+            if legacy:
+                logger.warning(
+                    f"RAG collection {collection.name} is empty while {len(legacy)} older collection(s) exist: "
+                    f"run 'python -m server.jobs.reindex' to index existing reports"
+                )
         
         # Initialize embeddings
         embeddings = OpenAIEmbeddings(
             openai_api_key=settings.OPENAI_API_KEY,
-            model="text-embedding-3-small"
+            model=settings.OPENAI_EMBEDDING_MODEL
         )
         
         logger.info("AI services initialized successfully")
@@ -72,48 +485,112 @@ def init_ai_services():
         logger.error(f"Failed to initialize AI services: {e}")
 
 
+class WhisperTranscriber:
+    """Transcribes one audio file with the OpenAI Whisper API"""
+    
+    async def transcribe(self, path: str) -> Optional[str]:
+        aclient = get_async_openai()
+        if not aclient:
+            return None
+        with open(path, "rb") as audio_file:
+            async def create():
+                audio_file.seek(0)  # retries must re-send the whole file
+                return await aclient.audio.transcriptions.create(
+                    model=settings.OPENAI_WHISPER_MODEL,
+                    file=audio_file,
+                    language="it"  # Italian for pharmaceutical context
+                )
+            transcript = await governor.call(create)
+        return transcript.text
+
+
+class StubTranscriber:
+    """Local stand-in for Whisper (tests, offline development)"""
+    
+    async def transcribe(self, path: str) -> Optional[str]:
+        return f"[trascrizione stub: {Path(path).name}]"
+
+
+_transcriber_override = None
+
+
+def set_transcriber(transcriber) -> None:
+    """Replace the transcription backend (None restores the configured one)"""
+    global _transcriber_override
+    _transcriber_override = transcriber
+
+
+def get_transcriber():
+    if _transcriber_override is not None:
+        return _transcriber_override
+    if settings.TRANSCRIBER == "stub":
+        return StubTranscriber()
+    return WhisperTranscriber() if settings.OPENAI_API_KEY else None
+
+
 async def transcribe_audio_real(audio_url: Optional[str]) -> Optional[str]:
     """
-    Real audio transcription using OpenAI Whisper API
+    Real audio transcription using OpenAI Whisper API.
+    With ffmpeg available the file is normalized to low-bitrate mono, stripped of
+    silences and split into chunks that are transcribed in parallel.
     """
-    if not audio_url or not openai_client:
+    transcriber = get_transcriber() if audio_url else None
+    if not transcriber:
         return None
     
     if not settings.ENABLE_AI_PROCESSING:
         return "[Audio transcription disabled]"
     
     try:
-        # Download audio file
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(audio_url)
-            response.raise_for_status()
+        # Download audio file (streamed, size-capped)
+        media = await fetch_media(audio_url)
         
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-            temp_file.write(response.content)
-            temp_path = temp_file.name
+        # Same voice note forwarded again: reuse the stored transcription
+        cache_key = None
+        if media_cache:
+            cache_key = media_cache.key_from_digest(media.sha256, _transcription_cache_version(transcriber))
+            cached = await run_blocking(media_cache.get, cache_key)
+            if cached is not None:
+                media.cleanup()
+                logger.info("Transcription served from media cache")
+                return cached
         
-        try:
-            # Transcribe with Whisper
-            with open(temp_path, "rb") as audio_file:
-                transcript = openai_client.audio.transcriptions.create(
-                    model=settings.OPENAI_WHISPER_MODEL,
-                    file=audio_file,
-                    language="it"  # Italian for pharmaceutical context
-                )
+        with tempfile.TemporaryDirectory(prefix="audio-") as workdir:
+            # Keep the original extension: ffmpeg probes the content anyway
+            src_path = media.write_to(os.path.join(workdir, f"source{media.suffix or '.audio'}"))
             
-            logger.info(f"Successfully transcribed audio: {len(transcript.text)} characters")
-            return transcript.text
-            
-        finally:
-            # Cleanup temp file
-            os.unlink(temp_path)
+            if ffmpeg_available():
+                chunk_dir = os.path.join(workdir, "chunks")
+                os.makedirs(chunk_dir)
+                chunks = await normalize_and_split(src_path, chunk_dir)
+                text = await transcribe_chunks(chunks, transcriber.transcribe) if chunks else ""
+            else:
+                logger.warning("ffmpeg not found: sending the original audio file")
+                text = (await transcriber.transcribe(src_path)) or ""
+        
+        logger.info(f"Successfully transcribed audio: {len(text)} characters")
+        if cache_key:
+            await run_blocking(media_cache.put, cache_key, text)
+        return text
             
     except Exception as e:
         logger.error(f"Audio transcription failed: {e}")
         return f"[Errore trascrizione: {str(e)}]"
 
 
+def _ocr_cache_version() -> str:
+    enhance = ",".join(str(b.get("model") or settings.OPENAI_MODEL) for b in ROUTES["ocr_enhance"]) if openai_client else "none"
+    return f"ocr:v1:ita+eng:--psm 6:{preprocess_options()}:enhance={enhance}"
+
+
+def _transcription_cache_version(transcriber) -> str:
+    return (
+        f"asr:v1:{type(transcriber).__name__}:{settings.OPENAI_WHISPER_MODEL}:"
+        f"{settings.AUDIO_BITRATE}:{settings.AUDIO_CHUNK_SECONDS}:"
+        f"{settings.AUDIO_SILENCE_THRESHOLD_DB}:{settings.AUDIO_SILENCE_MIN_SECONDS}"
+    )
+
+
 async def ocr_image_real(photo_url: Optional[str]) -> Optional[str]:
     """
     Real OCR using Tesseract + OpenAI GPT for enhancement
@@ -125,42 +602,41 @@ async def ocr_image_real(photo_url: Optional[str]) -> Optional[str]:
         return "[OCR processing disabled]"
     
     try:
-        # Download image
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(photo_url)
-            response.raise_for_status()
-        
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_file:
-            temp_file.write(response.content)
-            temp_path = temp_file.name
+        # Download image (streamed, size-capped)
+        media = await fetch_media(photo_url)
         
         try:
-            # Open and process image
-            image = Image.open(temp_path)
+            # Same brochure photo uploaded again: skip Tesseract and GPT entirely
+            cache_key = None
+            if media_cache:
+                cache_key = media_cache.key_from_digest(media.sha256, _ocr_cache_version())
+                cached = await run_blocking(media_cache.get, cache_key)
+                if cached is not None:
+                    logger.info("OCR served from media cache")
+                    return cached or None
             
-            # Basic OCR with Tesseract
-            if settings.TESSERACT_CMD:
-                pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
-            
-            # Extract text with Italian language support
-            ocr_text = pytesseract.image_to_string(
-                image, 
-                lang='ita+eng',
-                config='--psm 6'
-            ).strip()
+            # Tesseract on the OCR process pool (Italian + English); small images
+            # travel as bytes and are decoded in memory, large ones by path
+            ocr_text = await run_ocr(media.data if media.data is not None else media.path,
+                                     lang='ita+eng', config='--psm 6')
             
             # Enhance with OpenAI if available and text found
+            cacheable = True
             if ocr_text and openai_client and len(ocr_text) > 10:
                 enhanced_text = await enhance_ocr_with_ai(ocr_text)
-                return enhanced_text or ocr_text
+                # raw text is still returned, but never cached under the "enhanced" version
+                cacheable = enhanced_text is not None
+                ocr_text = enhanced_text or ocr_text
+            else:
+                logger.info(f"OCR extracted: {len(ocr_text)} characters")
             
-            logger.info(f"OCR extracted: {len(ocr_text)} characters")
+            if cache_key and cacheable:
+                await run_blocking(media_cache.put, cache_key, ocr_text or "")
             return ocr_text if ocr_text else None
             
         finally:
-            # Cleanup temp file
-            os.unlink(temp_path)
+            # Cleanup spooled file, if any
+            media.cleanup()
             
     except Exception as e:
         logger.error(f"OCR processing failed: {e}")
@@ -169,14 +645,23 @@ async def ocr_image_real(photo_url: Optional[str]) -> Optional[str]:
 
 async def enhance_ocr_with_ai(raw_ocr: str) -> Optional[str]:
     """
-    Enhance OCR text using OpenAI to fix errors and improve readability
+    Enhance OCR text using OpenAI to fix errors and improve readability.
+    Returns None when enhancement is unavailable or fails.
     """
-    if not openai_client:
-        return raw_ocr
+    aclient = get_async_openai()
+    if not aclient:
+        return None
+    
+    route = route_for("ocr_enhance", raw_ocr)
+    cache_key = make_key("ocr_enhance", route.model, OCR_ENHANCE_PROMPT_VERSION, raw_ocr)
+    cached = await _cached_result(cache_key)
+    if cached is not None:
+        return cached
     
     try:
-        response = openai_client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
+        response = await _chat_completion(
+            aclient,
+            route,
             messages=[
                 {
                     "role": "system",
@@ -190,17 +675,41 @@ async def enhance_ocr_with_ai(raw_ocr: str) -> Optional[str]:
                     "content": f"Correggi questo testo OCR:\n\n{raw_ocr}"
                 }
             ],
-            max_tokens=500,
             temperature=0.1
         )
         
         enhanced = response.choices[0].message.content.strip()
         logger.info("OCR text enhanced with AI")
+        await _store_result(cache_key, "ocr_enhance", enhanced)
         return enhanced
         
     except Exception as e:
         logger.error(f"OCR enhancement failed: {e}")
-        return raw_ocr
+        return None
+
+
+def _local_sentiment(text: str) -> Dict[str, Any]:
+    """
+    Basic sentiment with TextBlob (cheap, local)
+    """
+    blob = TextBlob(text)
+    polarity = blob.sentiment.polarity
+    subjectivity = blob.sentiment.subjectivity
+    
+    # Map polarity to categories
+    if polarity > 0.1:
+        basic_sentiment = "positive"
+    elif polarity < -0.1:
+        basic_sentiment = "negative"
+    else:
+        basic_sentiment = "neutral"
+    
+    return {
+        "sentiment": basic_sentiment,
+        "confidence": abs(polarity),
+        "subjectivity": subjectivity,
+        "polarity_score": polarity
+    }
 
 
 def analyze_sentiment_advanced(text: Optional[str]) -> Dict[str, Any]:
@@ -211,25 +720,7 @@ def analyze_sentiment_advanced(text: Optional[str]) -> Dict[str, Any]:
         return {"sentiment": "neutral", "confidence": 0.0, "emotions": {}}
     
     try:
-        # Basic sentiment with TextBlob
-        blob = TextBlob(text)
-        polarity = blob.sentiment.polarity
-        subjectivity = blob.sentiment.subjectivity
-        
-        # Map polarity to categories
-        if polarity > 0.1:
-            basic_sentiment = "positive"
-        elif polarity < -0.1:
-            basic_sentiment = "negative"
-        else:
-            basic_sentiment = "neutral"
-        
-        result = {
-            "sentiment": basic_sentiment,
-            "confidence": abs(polarity),
-            "subjectivity": subjectivity,
-            "polarity_score": polarity
-        }
+        result = _local_sentiment(text)
         
         # Enhanced analysis with OpenAI if available
         if openai_client and settings.ENABLE_AI_PROCESSING:
@@ -244,31 +735,106 @@ def analyze_sentiment_advanced(text: Optional[str]) -> Dict[str, Any]:
         return {"sentiment": "neutral", "confidence": 0.0, "error": str(e)}
 
 
+# How many texts the tiered mode settled locally vs sent to the LLM
+SENTIMENT_STATS: Dict[str, int] = {"local_accepted": 0, "llm_calls": 0}
+
+
+def sentiment_tier_config(tenant_ai_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Tiered sentiment thresholds: global defaults overridden by the tenant's
+    ai_config["sentimentTier"] ({"enabled", "minConfidence", "maxChars"})
+    """
+    config = {
+        "enabled": settings.SENTIMENT_TIER_ENABLED,
+        "minConfidence": settings.SENTIMENT_TIER_MIN_CONFIDENCE,
+        "maxChars": settings.SENTIMENT_TIER_MAX_CHARS,
+    }
+    config.update((tenant_ai_config or {}).get("sentimentTier") or {})
+    return config
+
+
+def _local_result_is_enough(result: Dict[str, Any], text: str, tier: Dict[str, Any]) -> bool:
+    return (
+        bool(tier.get("enabled"))
+        and len(text) <= tier["maxChars"]
+        and result["sentiment"] != "neutral"
+        and result["confidence"] >= tier["minConfidence"]
+    )
+
+
+async def analyze_sentiment_advanced_async(text: Optional[str],
+                                           tier: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Non-blocking variant of analyze_sentiment_advanced for the event loop.
+    Tiered: short, clearly polar texts keep the local result and skip the LLM.
+    """
+    if not text:
+        return {"sentiment": "neutral", "confidence": 0.0, "emotions": {}}
+    
+    try:
+        result = await run_blocking(_local_sentiment, text)
+        
+        if _local_result_is_enough(result, text, tier or sentiment_tier_config()):
+            SENTIMENT_STATS["local_accepted"] += 1
+            return result
+        
+        # Enhanced analysis with OpenAI if available
+        if openai_client and settings.ENABLE_AI_PROCESSING:
+            model = route_for("sentiment", text).model
+            cache_key = make_key("sentiment", model, SENTIMENT_PROMPT_VERSION, text, casefold=True)
+            enhanced = await _cached_result(cache_key)
+            if enhanced is None:
+                SENTIMENT_STATS["llm_calls"] += 1
+                if settings.SENTIMENT_BATCH_ENABLED:
+                    enhanced = await get_sentiment_batcher().analyze(text)
+                else:
+                    enhanced = await analyze_sentiment_with_ai_async(text)
+                await _store_result(cache_key, "sentiment", enhanced)
+            if enhanced:
+                result.update(enhanced)
+        
+        return result
+        
+    except Exception as e:
+        logger.error(f"Sentiment analysis failed: {e}")
+        return {"sentiment": "neutral", "confidence": 0.0, "error": str(e)}
+
+
+def get_sentiment_stats() -> Dict[str, Any]:
+    stats = dict(SENTIMENT_STATS)
+    total = stats["local_accepted"] + stats["llm_calls"]
+    stats["llm_avoided_ratio"] = round(stats["local_accepted"] / total, 3) if total else 0.0
+    return stats
+
+
+def _sentiment_messages(text: str) -> List[Dict[str, str]]:
+    return [
+        {
+            "role": "system",
+            "content": "Analizza il sentiment di questo testo dal settore farmaceutico/vendite. "
+                      "Rispondi in formato JSON con: sentiment (positive/negative/neutral), "
+                      "confidence (0-1), key_topics (array), emotions (object con fear, trust, satisfaction, concern). "
+                      "Considera il contesto medico/commerciale."
+        },
+        {
+            "role": "user",
+            "content": text
+        }
+    ]
+
+
 def analyze_sentiment_with_ai(text: str) -> Optional[Dict[str, Any]]:
     """
     Enhanced sentiment analysis using OpenAI for pharmaceutical/sales context
     """
     try:
-        response = openai_client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Analizza il sentiment di questo testo dal settore farmaceutico/vendite. "
-                              "Rispondi in formato JSON con: sentiment (positive/negative/neutral), "
-                              "confidence (0-1), key_topics (array), emotions (object con fear, trust, satisfaction, concern). "
-                              "Considera il contesto medico/commerciale."
-                },
-                {
-                    "role": "user",
-                    "content": text
-                }
-            ],
-            max_tokens=200,
+        response = _chat_completion_blocking(
+            openai_client,
+            route_for("sentiment", text),
+            messages=_sentiment_messages(text),
             temperature=0.1
         )
         
-        import json
         result = json.loads(response.choices[0].message.content)
         logger.info("Enhanced sentiment analysis completed")
         return result
@@ -278,12 +844,236 @@ def analyze_sentiment_with_ai(text: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+async def analyze_sentiment_with_ai_async(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Async variant of analyze_sentiment_with_ai
+    """
+    aclient = get_async_openai()
+    if not aclient:
+        return None
+    
+    try:
+        response = await _chat_completion(
+            aclient,
+            route_for("sentiment", text),
+            messages=_sentiment_messages(text),
+            temperature=0.1
+        )
+        
+        result = json.loads(response.choices[0].message.content)
+        logger.info("Enhanced sentiment analysis completed")
+        return result
+        
+    except Exception as e:
+        logger.error(f"AI sentiment analysis failed: {e}")
+        return None
+
+
+def _sentiment_batch_messages(texts: List[str]) -> List[Dict[str, str]]:
+    items = "\n\n".join(f"### id={i}\n{t}" for i, t in enumerate(texts))
+    return [
+        {
+            "role": "system",
+            "content": "Analizza il sentiment di ciascun testo dal settore farmaceutico/vendite. "
+                      "Rispondi in formato JSON con un oggetto {\"results\": [...]} contenente, per ogni testo, "
+                      "id (numero del testo), sentiment (positive/negative/neutral), "
+                      "confidence (0-1), key_topics (array), emotions (object con fear, trust, satisfaction, concern). "
+                      "Considera il contesto medico/commerciale."
+        },
+        {
+            "role": "user",
+            "content": items
+        }
+    ]
+
+
+async def analyze_sentiment_batch_with_ai(texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Sentiment for many texts in one structured-output completion. Results are
+    returned in input order; texts the model skipped get None. If the batch reply
+    is not valid JSON (e.g. truncated) every text is retried on its own.
+    """
+    aclient = get_async_openai()
+    if not aclient or not texts:
+        return [None] * len(texts)
+    if len(texts) == 1:
+        return [await analyze_sentiment_with_ai_async(texts[0])]
+    
+    response = await _chat_completion(
+        aclient,
+        route_for("sentiment", "".join(texts)),
+        messages=_sentiment_batch_messages(texts),
+        # same output budget per text as the single-text route
+        max_tokens=sum(route_for("sentiment", t).max_tokens for t in texts),
+        temperature=0.1,
+        response_format={"type": "json_object"}
+    )
+    
+    try:
+        payload = json.loads(response.choices[0].message.content)
+        if not isinstance(payload, dict):
+            raise ValueError(f"expected a JSON object, got {type(payload).__name__}")
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Batched sentiment reply unparsable ({e}), falling back to {len(texts)} single calls")
+        return list(await asyncio.gather(*(analyze_sentiment_with_ai_async(t) for t in texts)))
+    by_id: Dict[int, Dict[str, Any]] = {}
+    for item in payload.get("results", []):
+        try:
+            idx = int(item.pop("id"))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        if 0 <= idx < len(texts):
+            by_id[idx] = item
+    logger.info(f"Batched sentiment analysis completed: {len(by_id)}/{len(texts)} texts")
+    return [by_id.get(i) for i in range(len(texts))]
+
+
+class SentimentBatcher:
+    """
+    Micro-batcher for LLM sentiment: concurrent callers are grouped into one request
+    until the token budget or item cap is reached, or max_wait elapses.
+    """
+    
+    def __init__(self, token_budget: int, max_items: int, max_wait: float):
+        self.token_budget = token_budget
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self._pending: List[Any] = []  # (text, future)
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()  # the loop only keeps weak references
+    
+    async def analyze(self, text: str) -> Optional[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        tokens = estimate_tokens(text)
+        if self._pending and self._pending_tokens + tokens > self.token_budget:
+            self._flush()
+        fut = loop.create_future()
+        self._pending.append((text, fut))
+        self._pending_tokens += tokens
+        if len(self._pending) >= self.max_items or self._pending_tokens >= self.token_budget:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+    
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_tokens = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: List[Any]) -> None:
+        try:
+            results = await analyze_sentiment_batch_with_ai([text for text, _ in batch])
+        except Exception as e:
+            logger.error(f"Batched sentiment analysis failed: {e}")
+            results = [None] * len(batch)
+        for (text, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+
+
+_sentiment_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SentimentBatcher]" = weakref.WeakKeyDictionary()
+
+
+def get_sentiment_batcher() -> SentimentBatcher:
+    loop = asyncio.get_running_loop()
+    batcher = _sentiment_batchers.get(loop)
+    if batcher is None:
+        batcher = SentimentBatcher(
+            token_budget=settings.SENTIMENT_BATCH_TOKEN_BUDGET,
+            max_items=settings.SENTIMENT_BATCH_MAX_ITEMS,
+            max_wait=settings.SENTIMENT_BATCH_MAX_WAIT_MS / 1000,
+        )
+        _sentiment_batchers[loop] = batcher
+    return batcher
+
+
+QA_SYSTEM_PROMPT = (
+    "Sei un assistente esperto del settore farmaceutico che risponde a domande "
+    "basandoti sui report di campo forniti. Rispondi in italiano, sii preciso e "
+    "cita i dati specifici quando possibile. Se i dati non sono sufficienti, "
+    "dillo chiaramente."
+)
+
+
+async def _qa_retrieve(query: str, product_line_id: Optional[str],
+                       tenant_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Retrieval half of RAG: answer cache, query embedding and Chroma search.
+    Returns the cached answer under "cached" when there is one.
+    """
+    # Answer cache: exact repeat first, then paraphrases by embedding similarity
+    scope = qa_scope(tenant_id, product_line_id)
+    version = await run_blocking(qa_cache.version, scope) if qa_cache else 0
+    state = {"scope": scope, "version": version, "embedding": None, "cached": None}
+    if qa_cache:
+        state["cached"] = qa_cache.get_exact(scope, version, query)
+        if state["cached"] is not None:
+            return state
+    
+    # Create query embedding (LRU cache, then the API)
+    query_embedding = await embed_query_cached(query)
+    state["embedding"] = query_embedding
+    
+    if qa_cache:
+        state["cached"] = qa_cache.get_similar(scope, version, query_embedding)
+        if state["cached"] is not None:
+            return state
+    
+    # Search similar documents in ChromaDB
+    results = await run_blocking(
+        _rag_call,
+        "query",
+        query_embeddings=[query_embedding],
+        n_results=5,
+        where={
+            "$and": [
+                {"tenant_id": {"$eq": tenant_id}} if tenant_id else {},
+                {"product_line_id": {"$eq": product_line_id}} if product_line_id else {}
+            ]
+        } if tenant_id or product_line_id else None
+    )
+    
+    # Build context from retrieved documents
+    context_docs = []
+    citations = []
+    
+    if results['documents'] and results['documents'][0]:
+        for i, (doc, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0])):
+            context_docs.append(doc)
+            citations.append({
+                "reportId": metadata.get("report_id"),
+                "section": metadata.get("section", "summary"),
+                "weekId": metadata.get("week_id"),
+                "score": results['distances'][0][i] if results['distances'] else 0.0
+            })
+    
+    state["context"] = "\n\n".join(context_docs[:3])  # Use top 3 results
+    state["citations"] = citations[:3]
+    state["context_used"] = len(context_docs)
+    return state
+
+
+def _qa_messages(context: str, query: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": QA_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Contesto dai report:\n{context}\n\nDomanda: {query}"}
+    ]
+
+
 async def qa_with_rag(query: str, product_line_id: Optional[str] = None, 
                      tenant_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Advanced Q&A using RAG (Retrieval Augmented Generation) with ChromaDB + OpenAI
     """
-    if not openai_client or not collection:
+    aclient = get_async_openai()
+    if not aclient or not collection:
         return {
             "answer": "Sistema Q&A non configurato",
             "citations": [],
@@ -291,54 +1081,15 @@ async def qa_with_rag(query: str, product_line_id: Optional[str] = None,
         }
     
     try:
-        # Create query embedding
-        query_embedding = embeddings.embed_query(query)
-        
-        # Search similar documents in ChromaDB
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=5,
-            where={
-                "$and": [
-                    {"tenant_id": {"$eq": tenant_id}} if tenant_id else {},
-                    {"product_line_id": {"$eq": product_line_id}} if product_line_id else {}
-                ]
-            } if tenant_id or product_line_id else None
-        )
-        
-        # Build context from retrieved documents
-        context_docs = []
-        citations = []
-        
-        if results['documents'] and results['documents'][0]:
-            for i, (doc, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0])):
-                context_docs.append(doc)
-                citations.append({
-                    "reportId": metadata.get("report_id"),
-                    "section": metadata.get("section", "summary"),
-                    "weekId": metadata.get("week_id"),
-                    "score": results['distances'][0][i] if results['distances'] else 0.0
-                })
-        
-        context = "\n\n".join(context_docs[:3])  # Use top 3 results
+        state = await _qa_retrieve(query, product_line_id, tenant_id)
+        if state["cached"] is not None:
+            return state["cached"]
         
         # Generate answer with OpenAI
-        response = openai_client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Sei un assistente esperto del settore farmaceutico che risponde a domande "
-                              "basandoti sui report di campo forniti. Rispondi in italiano, sii preciso e "
-                              "cita i dati specifici quando possibile. Se i dati non sono sufficienti, "
-                              "dillo chiaramente."
-                },
-                {
-                    "role": "user",
-                    "content": f"Contesto dai report:\n{context}\n\nDomanda: {query}"
-                }
-            ],
-            max_tokens=500,
+        response = await _chat_completion(
+            aclient,
+            route_for("qa", state["context"] + query),
+            messages=_qa_messages(state["context"], query),
             temperature=0.2
         )
         
@@ -346,11 +1097,14 @@ async def qa_with_rag(query: str, product_line_id: Optional[str] = None,
         
         logger.info(f"Q&A completed for query: {query[:50]}...")
         
-        return {
+        result = {
             "answer": answer,
-            "citations": citations[:3],
-            "context_used": len(context_docs)
+            "citations": state["citations"],
+            "context_used": state["context_used"]
         }
+        if qa_cache:
+            qa_cache.put(state["scope"], state["version"], query, state["embedding"], result)
+        return result
         
     except Exception as e:
         logger.error(f"Q&A with RAG failed: {e}")
@@ -361,67 +1115,160 @@ async def qa_with_rag(query: str, product_line_id: Optional[str] = None,
         }
 
 
-def index_report_for_rag(report_id: str, executive_summary: str, ci_summary: str,
-                        week_id: str, tenant_id: str, product_line_id: str):
+async def qa_with_rag_stream(query: str, product_line_id: Optional[str] = None,
+                             tenant_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
     """
-    Index a report in ChromaDB for RAG Q&A
+    Streaming variant of qa_with_rag. Yields events as soon as they are available:
+    {"event": "citations"} right after retrieval, then {"event": "token"} per answer
+    delta, then {"event": "done"}; {"event": "error"} replaces whatever is left on failure.
     """
-    if not collection or not embeddings:
+    aclient = get_async_openai()
+    if not aclient or not collection:
+        yield {"event": "error", "data": {"error": "OpenAI or ChromaDB not initialized"}}
         return
     
     try:
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50
-        )
+        state = await _qa_retrieve(query, product_line_id, tenant_id)
+        cached = state["cached"]
+        if cached is not None:
+            yield {"event": "citations", "data": cached["citations"]}
+            yield {"event": "token", "data": cached["answer"]}
+            yield {"event": "done", "data": {"cached": True}}
+            return
         
-        documents = []
-        metadatas = []
-        ids = []
+        yield {"event": "citations", "data": state["citations"]}
         
-        # Index executive summary
-        if executive_summary:
-            summary_chunks = text_splitter.split_text(executive_summary)
-            for i, chunk in enumerate(summary_chunks):
-                documents.append(chunk)
-                metadatas.append({
-                    "report_id": report_id,
-                    "section": "executive_summary",
-                    "week_id": week_id,
-                    "tenant_id": tenant_id,
-                    "product_line_id": product_line_id,
-                    "chunk_index": i
-                })
-                ids.append(f"{report_id}_summary_{i}")
-        
-        # Index CI summary
-        if ci_summary:
-            ci_chunks = text_splitter.split_text(ci_summary)
-            for i, chunk in enumerate(ci_chunks):
-                documents.append(chunk)
-                metadatas.append({
+        parts = []
+        # aclosing: if the SSE client goes away this generator is closed, and the
+        # completion stream with it instead of whenever it is garbage collected
+        async with contextlib.aclosing(_chat_completion_stream(
+            aclient,
+            route_for("qa", state["context"] + query),
+            messages=_qa_messages(state["context"], query),
+            temperature=0.2
+        )) as deltas:
+            async for delta in deltas:
+                parts.append(delta)
+                yield {"event": "token", "data": delta}
+        
+        logger.info(f"Streamed Q&A completed for query: {query[:50]}...")
+        
+        result = {
+            "answer": "".join(parts),
+            "citations": state["citations"],
+            "context_used": state["context_used"]
+        }
+        if qa_cache:
+            qa_cache.put(state["scope"], state["version"], query, state["embedding"], result)
+        yield {"event": "done", "data": {"cached": False}}
+        
+    except Exception as e:
+        logger.error(f"Streaming Q&A with RAG failed: {e}")
+        yield {"event": "error", "data": {"error": str(e)}}
+
+
+def _chunk_hash(document: str) -> str:
+    # the embedding model is part of the hash: changing it re-embeds everything
+    return hashlib.sha256(f"{settings.OPENAI_EMBEDDING_MODEL}\x00{document}".encode("utf-8")).hexdigest()
+
+
+def report_chunks(report_id: str, executive_summary: str, ci_summary: str,
+                  week_id: str, tenant_id: str, product_line_id: str) -> List[Dict[str, Any]]:
+    """
+    Split a report into RAG chunks with stable ids ({report_id}_summary_{i}, {report_id}_ci_{i})
+    and metadata including the content hash
+    """
+    # Split text into chunks
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=500,
+        chunk_overlap=50
+    )
+    
+    chunks = []
+    for section, prefix, text in (("executive_summary", "summary", executive_summary),
+                                  ("ci_summary", "ci", ci_summary)):
+        if not text:
+            continue
+        for i, chunk in enumerate(text_splitter.split_text(text)):
+            chunks.append({
+                "id": f"{report_id}_{prefix}_{i}",
+                "document": chunk,
+                "metadata": {
                     "report_id": report_id,
-                    "section": "ci_summary",
+                    "section": section,
                     "week_id": week_id,
                     "tenant_id": tenant_id,
                     "product_line_id": product_line_id,
-                    "chunk_index": i
-                })
-                ids.append(f"{report_id}_ci_{i}")
-        
-        if documents:
-            # Generate embeddings and store
-            collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
-            
-            logger.info(f"Indexed report {report_id} with {len(documents)} chunks")
+                    "chunk_index": i,
+                    "content_hash": _chunk_hash(chunk)
+                }
+            })
+    return chunks
+
+
+def sync_report_chunks(report_ids: List[str], chunks: List[Dict[str, Any]],
+                       embed: Optional[Callable[[List[str]], List[List[float]]]] = None) -> Dict[str, int]:
+    """
+    Make the collection hold exactly `chunks` for `report_ids`: upsert new or changed
+    chunks (only those are embedded), delete chunks the reports no longer have, and
+    skip chunks whose content hash is unchanged. Safe to re-run.
+    """
+    embed = embed or embed_documents_batched
+    existing = _rag_call("get", where={"report_id": {"$in": list(report_ids)}}, include=["metadatas"])
+    stored = {
+        chunk_id: (metadata or {}).get("content_hash")
+        for chunk_id, metadata in zip(existing["ids"], existing["metadatas"] or [])
+    }
+    
+    changed = [c for c in chunks if stored.get(c["id"]) != c["metadata"]["content_hash"]]
+    wanted = {c["id"] for c in chunks}
+    orphans = [chunk_id for chunk_id in stored if chunk_id not in wanted]
+    
+    if changed:
+        # Same OpenAI model as the queries, in as few calls as possible
+        vectors = embed([c["document"] for c in changed])
+        collection.upsert(
+            ids=[c["id"] for c in changed],
+            documents=[c["document"] for c in changed],
+            embeddings=vectors,
+            metadatas=[c["metadata"] for c in changed]
+        )
+    if orphans:
+        collection.delete(ids=orphans)
+    
+    return {
+        "chunks": len(chunks),
+        "embedded": len(changed),
+        "unchanged": len(chunks) - len(changed),
+        "deleted": len(orphans)
+    }
+
+
+def index_report_for_rag(report_id: str, executive_summary: str, ci_summary: str,
+                        week_id: str, tenant_id: str, product_line_id: str) -> Optional[Dict[str, int]]:
+    """
+    Index a report in ChromaDB for RAG Q&A (idempotent: only changed chunks are re-embedded)
+    """
+    if not collection or not embeddings:
+        return None
+    
+    try:
+        chunks = report_chunks(report_id, executive_summary, ci_summary, week_id, tenant_id, product_line_id)
+        stats = sync_report_chunks([report_id], chunks)
+        
+        logger.info(
+            f"Indexed report {report_id}: {stats['chunks']} chunks, {stats['embedded']} embedded, "
+            f"{stats['unchanged']} unchanged, {stats['deleted']} deleted"
+        )
+        
+        # Cached Q&A answers for this scope may now be outdated
+        if qa_cache and (stats["embedded"] or stats["deleted"]):
+            qa_cache.invalidate(tenant_id, product_line_id)
+        return stats
         
     except Exception as e:
         logger.error(f"Failed to index report {report_id}: {e}")
+        return None
 
 
 # Compatibility functions for existing code
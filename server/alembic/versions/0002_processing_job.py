@@ -0,0 +1,41 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002_processing_job'
+down_revision = '0001_initial'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'processing_job',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('insight_id', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('lease_owner', sa.String(), nullable=True),
+        sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index('ix_processing_job_insight_id', 'processing_job', ['insight_id'])
+    op.create_index('ix_processing_job_claim', 'processing_job', ['status', 'priority', 'created_at'])
+    # al massimo un job attivo per insight, anche con sweep di avvio concorrenti
+    op.create_index(
+        'uq_processing_job_active_insight',
+        'processing_job',
+        ['insight_id'],
+        unique=True,
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+        sqlite_where=sa.text("status IN ('queued', 'running')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_processing_job_active_insight', table_name='processing_job')
+    op.drop_index('ix_processing_job_claim', table_name='processing_job')
+    op.drop_index('ix_processing_job_insight_id', table_name='processing_job')
+    op.drop_table('processing_job')
@@ -0,0 +1,15 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003_tenant_ai_config'
+down_revision = '0002_processing_job'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('tenant', sa.Column('ai_config', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tenant', 'ai_config')
@@ -0,0 +1,27 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004_ai_result_cache'
+down_revision = '0003_tenant_ai_config'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ai_result_cache',
+        sa.Column('key', sa.String(), primary_key=True),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('value', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True)),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_used_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_ai_result_cache_expires_at', 'ai_result_cache', ['expires_at'])
+    op.create_index('ix_ai_result_cache_last_used_at', 'ai_result_cache', ['last_used_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ai_result_cache_last_used_at', table_name='ai_result_cache')
+    op.drop_index('ix_ai_result_cache_expires_at', table_name='ai_result_cache')
+    op.drop_table('ai_result_cache')
@@ -0,0 +1,23 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005_processing_job_fairness'
+down_revision = '0004_ai_result_cache'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('processing_job', sa.Column('tenant_id', sa.String(), nullable=True))
+    op.add_column('processing_job', sa.Column('virtual_time', sa.Float(), nullable=False, server_default='0'))
+    op.create_index('ix_processing_job_tenant_id', 'processing_job', ['tenant_id'])
+    op.drop_index('ix_processing_job_claim', table_name='processing_job')
+    op.create_index('ix_processing_job_claim', 'processing_job', ['status', 'priority', 'virtual_time'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_processing_job_claim', table_name='processing_job')
+    op.create_index('ix_processing_job_claim', 'processing_job', ['status', 'priority', 'created_at'])
+    op.drop_index('ix_processing_job_tenant_id', table_name='processing_job')
+    op.drop_column('processing_job', 'virtual_time')
+    op.drop_column('processing_job', 'tenant_id')
@@ -0,0 +1,76 @@
+"""
+Audio pipeline: ffmpeg normalization (mono, low bitrate, silence removal) and
+splitting of long recordings into chunks that can be transcribed in parallel.
+"""
+
+import asyncio
+import shutil
+import logging
+from pathlib import Path
+from typing import List, Optional, Callable, Awaitable
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(settings.FFMPEG_BIN) is not None
+
+
+def _ffmpeg_args(src: str, out_pattern: str) -> List[str]:
+    silence = (
+        f"silenceremove=stop_periods=-1"
+        f":stop_duration={settings.AUDIO_SILENCE_MIN_SECONDS}"
+        f":stop_threshold={settings.AUDIO_SILENCE_THRESHOLD_DB}dB"
+    )
+    return [
+        settings.FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", src,
+        "-vn",                 # drop cover art / video tracks
+        "-ac", "1",            # mono
+        "-ar", "16000",        # Whisper resamples to 16 kHz anyway
+        "-af", silence,
+        "-c:a", "libmp3lame", "-b:a", settings.AUDIO_BITRATE,
+        "-f", "segment",
+        "-segment_time", str(settings.AUDIO_CHUNK_SECONDS),
+        "-reset_timestamps", "1",
+        out_pattern,
+    ]
+
+
+async def normalize_and_split(src_path: str, workdir: str) -> List[str]:
+    """
+    Transcode any input format to low-bitrate mono MP3 without long silences and
+    split it into AUDIO_CHUNK_SECONDS segments. Returns chunk paths in playback order.
+    """
+    out_pattern = str(Path(workdir) / "chunk_%04d.mp3")
+    proc = await asyncio.create_subprocess_exec(
+        *_ffmpeg_args(src_path, out_pattern),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, stderr = await asyncio.wait_for(proc.communicate(), settings.AUDIO_FFMPEG_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise RuntimeError(f"ffmpeg timed out after {settings.AUDIO_FFMPEG_TIMEOUT_SECONDS}s")
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()[:300]}")
+    chunks = sorted(str(p) for p in Path(workdir).glob("chunk_*.mp3"))
+    logger.info(f"Audio normalized into {len(chunks)} chunk(s)")
+    return chunks
+
+
+async def transcribe_chunks(chunks: List[str],
+                            transcribe: Callable[[str], Awaitable[Optional[str]]]) -> str:
+    """Transcribe chunks concurrently (TRANSCRIBE_CONCURRENCY) and join them in order"""
+    sem = asyncio.Semaphore(max(1, settings.TRANSCRIBE_CONCURRENCY))
+
+    async def one(path: str) -> Optional[str]:
+        async with sem:
+            return await transcribe(path)
+
+    parts = await asyncio.gather(*(one(c) for c in chunks))
+    return " ".join(p.strip() for p in parts if p and p.strip())
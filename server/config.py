@@ -40,9 +40,84 @@ class Settings:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     OPENAI_WHISPER_MODEL = os.getenv("OPENAI_WHISPER_MODEL", "whisper-1")
+    OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+    EMBEDDING_CACHE_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", "4096"))  # LRU embedding delle query
+    EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "2048"))  # limite input per richiesta API
+    EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "250000"))  # sotto i 300k per richiesta
+    OPENAI_ROUTES = os.getenv("OPENAI_ROUTES")  # JSON: {"task": [{"maxChars", "model", "maxTokens"}, ...]}
+    OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))  # quota di questa replica
+    OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+    OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+    OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE_SECONDS", "1.0"))
+    OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", "30"))
+    TRANSCRIBER = os.getenv("TRANSCRIBER", "whisper")  # whisper | stub
+    FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+    AUDIO_BITRATE = os.getenv("AUDIO_BITRATE", "32k")
+    AUDIO_CHUNK_SECONDS = int(os.getenv("AUDIO_CHUNK_SECONDS", "600"))
+    AUDIO_SILENCE_THRESHOLD_DB = int(os.getenv("AUDIO_SILENCE_THRESHOLD_DB", "-40"))
+    AUDIO_SILENCE_MIN_SECONDS = float(os.getenv("AUDIO_SILENCE_MIN_SECONDS", "1.0"))
+    AUDIO_FFMPEG_TIMEOUT_SECONDS = int(os.getenv("AUDIO_FFMPEG_TIMEOUT_SECONDS", "300"))
+    TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))  # chunk in parallelo per file
     ENABLE_AI_PROCESSING = os.getenv("ENABLE_AI_PROCESSING", "true").lower() == "true"
     TESSERACT_CMD = os.getenv("TESSERACT_CMD")  # Path to tesseract executable
+    OCR_PROCESSES = int(os.getenv("OCR_PROCESSES", str(os.cpu_count() or 2)))
+    OCR_TIMEOUT_SECONDS = int(os.getenv("OCR_TIMEOUT_SECONDS", "60"))  # per immagine
+    OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "true").lower() == "true"
+    # lato lungo in px dopo il downscale: 2000 ≈ 170 DPI su un A4 a tutto schermo (3508 = 300 DPI).
+    # Da tarare con scripts/bench_ocr_preprocess.py --max-side 2000,2480,3508 sulle foto reali
+    OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2000"))
+    OCR_BINARIZE = os.getenv("OCR_BINARIZE", "true").lower() == "true"
+    OCR_DESKEW = os.getenv("OCR_DESKEW", "true").lower() == "true"
+    OCR_CROP_TEXT = os.getenv("OCR_CROP_TEXT", "false").lower() == "true"
     CHROMADB_PATH = os.getenv("CHROMADB_PATH", "./data/chromadb")
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+    HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(200 * 1024 * 1024)))  # oltre: rifiutato
+    MEDIA_IN_MEMORY_MAX_BYTES = int(os.getenv("MEDIA_IN_MEMORY_MAX_BYTES", str(8 * 1024 * 1024)))  # oltre: su disco
+    # spento di default: TextBlob usa un lessico inglese e sugli insight in italiano dà
+    # polarità ~0 (nessun risparmio) o verdetti falsati dai prestiti inglesi che saltano l'LLM.
+    # Attivarlo solo per tenant con testi in inglese (ai_config.sentimentTier.enabled)
+    SENTIMENT_TIER_ENABLED = os.getenv("SENTIMENT_TIER_ENABLED", "false").lower() == "true"
+    SENTIMENT_TIER_MIN_CONFIDENCE = float(os.getenv("SENTIMENT_TIER_MIN_CONFIDENCE", "0.5"))  # |polarity| TextBlob
+    SENTIMENT_TIER_MAX_CHARS = int(os.getenv("SENTIMENT_TIER_MAX_CHARS", "280"))
+    SENTIMENT_BATCH_ENABLED = os.getenv("SENTIMENT_BATCH_ENABLED", "true").lower() == "true"
+    SENTIMENT_BATCH_MAX_ITEMS = int(os.getenv("SENTIMENT_BATCH_MAX_ITEMS", "20"))
+    SENTIMENT_BATCH_TOKEN_BUDGET = int(os.getenv("SENTIMENT_BATCH_TOKEN_BUDGET", "6000"))  # token di input per richiesta
+    SENTIMENT_BATCH_MAX_WAIT_MS = int(os.getenv("SENTIMENT_BATCH_MAX_WAIT_MS", "250"))
+    AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+    AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+    AI_CACHE_MAX_ROWS = int(os.getenv("AI_CACHE_MAX_ROWS", "100000"))
+    AI_CACHE_LOCAL_MAX_ITEMS = int(os.getenv("AI_CACHE_LOCAL_MAX_ITEMS", "5000"))  # LRU in-process
+    QA_CACHE_ENABLED = os.getenv("QA_CACHE_ENABLED", "true").lower() == "true"
+    QA_CACHE_SIMILARITY = float(os.getenv("QA_CACHE_SIMILARITY", "0.95"))  # coseno minimo per riusare una risposta
+    QA_CACHE_TTL_SECONDS = int(os.getenv("QA_CACHE_TTL_SECONDS", str(6 * 3600)))
+    QA_CACHE_MAX_ITEMS = int(os.getenv("QA_CACHE_MAX_ITEMS", "2000"))
+    QA_CACHE_MAX_ITEMS_PER_SCOPE = int(os.getenv("QA_CACHE_MAX_ITEMS_PER_SCOPE", "200"))  # limita la scansione per similarità
+    MEDIA_CACHE_ENABLED = os.getenv("MEDIA_CACHE_ENABLED", "true").lower() == "true"
+    MEDIA_CACHE_PATH = os.getenv("MEDIA_CACHE_PATH", "./data/media_cache")
+    MEDIA_CACHE_MAX_MB = int(os.getenv("MEDIA_CACHE_MAX_MB", "256"))
+    # le trascrizioni in cache non sono ancora anonimizzate: conservazione massima
+    MEDIA_CACHE_TTL_HOURS = int(os.getenv("MEDIA_CACHE_TTL_HOURS", "72"))
+    AI_BLOCKING_THREADS = int(os.getenv("AI_BLOCKING_THREADS", "8"))  # pool per SDK sincroni (Chroma, embeddings)
+
+    # Processing pipeline
+    # task concorrenti sul loop di processing per classe di priorità (text < image < audio):
+    # un worker di una classe serve anche le classi più urgenti, mai quelle più lente
+    PROCESSING_LANE_WORKERS = os.getenv("PROCESSING_LANE_WORKERS", "text=2,image=1,audio=1")
+    # fair queuing tra tenant: "tenantId=3,altroId=0.5", gli altri hanno peso PROCESSING_DEFAULT_TENANT_WEIGHT
+    PROCESSING_TENANT_WEIGHTS = os.getenv("PROCESSING_TENANT_WEIGHTS", "")
+    PROCESSING_DEFAULT_TENANT_WEIGHT = float(os.getenv("PROCESSING_DEFAULT_TENANT_WEIGHT", "1"))
+    PROCESSING_BACKLOG_MAX = int(os.getenv("PROCESSING_BACKLOG_MAX", "10000"))  # oltre: POST /insights risponde 503
+    PROCESSING_RETRY_AFTER_MAX_SECONDS = int(os.getenv("PROCESSING_RETRY_AFTER_MAX_SECONDS", "300"))
+    INSIGHTS_BATCH_MAX_ITEMS = int(os.getenv("INSIGHTS_BATCH_MAX_ITEMS", "100"))  # POST /insights:batch
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))  # replay di Idempotency-Key
+    PROCESSING_THREADS = int(os.getenv("PROCESSING_THREADS", str(os.cpu_count() or 2)))  # pool per lavoro bloccante/CPU
+    PROCESSING_EMBEDDED_WORKERS = os.getenv("PROCESSING_EMBEDDED_WORKERS", "true").lower() == "true"  # false = solo worker dedicati
+    PROCESSING_LEASE_SECONDS = int(os.getenv("PROCESSING_LEASE_SECONDS", "300"))
+    PROCESSING_MAX_ATTEMPTS = int(os.getenv("PROCESSING_MAX_ATTEMPTS", "3"))
+    PROCESSING_POLL_SECONDS = float(os.getenv("PROCESSING_POLL_SECONDS", "2"))
+    MEDIA_STAGE_CONCURRENCY = int(os.getenv("MEDIA_STAGE_CONCURRENCY", "2"))  # stage media paralleli per insight
 
 
 settings = Settings()
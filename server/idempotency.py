@@ -0,0 +1,75 @@
+"""
+Idempotency-Key support for insight creation.
+
+The response of a create call is stored in the idempotency_key table in the same
+transaction as the insight and its processing job, unique per (tenant, user, key):
+two users never see each other's responses, even with the same key and body.
+A retry with the same key gets the stored response back without creating a new
+insight or touching the processing queue. Records expire after IDEMPOTENCY_TTL_SECONDS.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Any
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+_stores_since_prune = 0
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite returns naive datetimes: they are stored in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def scope_for(tenant_id: Optional[str], user_id: Optional[str]) -> str:
+    return f"{tenant_id or '-'}:{user_id or '-'}"
+
+
+def fingerprint(endpoint: str, payload: Any) -> str:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{endpoint}\x00{body}".encode("utf-8")).hexdigest()
+
+
+def lookup(session: Session, scope: str, key: str) -> Optional[IdempotencyKey]:
+    """Live record for (scope, key); an expired one is deleted so the key can be reused"""
+    row = session.query(IdempotencyKey).filter(IdempotencyKey.scope == scope, IdempotencyKey.key == key).first()
+    if row is None:
+        return None
+    if _aware(row.expires_at) < _utcnow():
+        session.delete(row)
+        session.flush()
+        return None
+    return row
+
+
+def remember(session: Session, scope: str, key: str, request_fingerprint: str,
+             status_code: int, response: Any) -> None:
+    """Add the record to the caller's transaction: it commits together with the insight"""
+    global _stores_since_prune
+    session.add(IdempotencyKey(
+        scope=scope,
+        key=key,
+        fingerprint=request_fingerprint,
+        status_code=status_code,
+        response=response,
+        expires_at=_utcnow() + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS),
+    ))
+    _stores_since_prune += 1
+    if _stores_since_prune >= 500:
+        _stores_since_prune = 0
+        session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < _utcnow()))
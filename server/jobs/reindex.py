@@ -0,0 +1,194 @@
+"""
+Backfill / reindex della collection Chroma del Q&A a partire dai WeeklyReport nel DB.
+
+Da usare dopo un cambio di modello di embedding (la collection ha il nome del modello,
+quindi parte vuota) o la perdita del volume di Chroma; --recreate svuota la collection
+del modello corrente e ricostruisce tutto da zero. Le repliche API in esecuzione riaprono
+la collection per nome alla prima query fallita, ma finché il backfill non è finito il
+Q&A risponde su un indice parziale: meglio lanciarlo in una finestra di manutenzione.
+I report sono letti a pagine (keyset su id), spezzati in chunk e sincronizzati con
+sync_report_chunks: solo i chunk nuovi o cambiati vengono embeddati, in batch paralleli
+che passano dal rate governor condiviso. Dopo ogni pagina viene scritto un checkpoint e
+invalidata la cache Q&A degli scope toccati, quindi una run interrotta riparte
+dall'ultima pagina completata senza lasciare risposte in cache non aggiornate.
+
+Uso: python -m server.jobs.reindex [--page-size 100] [--batch-size 256] [--parallel 4]
+                                   [--tenant ID] [--product-line ID] [--restart] [--recreate]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from ..db import SessionLocal, init_db
+from ..models import WeeklyReport
+from .. import ai_services
+from ..ai_services import (
+    init_ai_services,
+    recreate_rag_collection,
+    report_chunks,
+    sync_report_chunks,
+    embed_documents_batched,
+    estimate_tokens,
+)
+from ..qa_cache import qa_cache
+
+DEFAULT_CHECKPOINT = "./data/reindex_checkpoint.json"
+
+
+def load_checkpoint(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_checkpoint(path: Path, state: Dict[str, Any]) -> None:
+    # scrittura atomica: un kill a metà non lascia un checkpoint illeggibile
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def fetch_page(after_id: Optional[str], page_size: int, tenant_id: Optional[str],
+               product_line_id: Optional[str]) -> List[Dict[str, Any]]:
+    """Una pagina di report in ordine di id (keyset: nessun OFFSET che rallenta col procedere)"""
+    session = SessionLocal()
+    try:
+        q = session.query(
+            WeeklyReport.id,
+            WeeklyReport.executive_summary,
+            WeeklyReport.ci_summary,
+            WeeklyReport.week_id,
+            WeeklyReport.tenant_id,
+            WeeklyReport.product_line_id,
+        )
+        if after_id:
+            q = q.filter(WeeklyReport.id > after_id)
+        if tenant_id:
+            q = q.filter(WeeklyReport.tenant_id == tenant_id)
+        if product_line_id:
+            q = q.filter(WeeklyReport.product_line_id == product_line_id)
+        return [row._asdict() for row in q.order_by(WeeklyReport.id).limit(page_size).all()]
+    finally:
+        session.close()
+
+
+def parallel_embedder(batch_size: int, parallel: int, pool: ThreadPoolExecutor, counters: Dict[str, int]):
+    """embed() per sync_report_chunks: i testi di una pagina sono divisi in almeno
+    `parallel` batch (al massimo batch_size testi l'uno) embeddati in parallelo, così
+    tutti i worker lavorano anche quando una pagina produce pochi chunk.
+    Il governor tiene le chiamate sotto RPM/TPM; risultati nell'ordine di input."""
+    def embed(texts: List[str]) -> List[List[float]]:
+        size = max(1, min(batch_size, -(-len(texts) // parallel)))
+        batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+        vectors: List[List[float]] = []
+        for result in pool.map(embed_documents_batched, batches):
+            vectors.extend(result)
+        counters["tokens"] += sum(estimate_tokens(t) for t in texts)
+        return vectors
+    return embed
+
+
+def run(args) -> int:
+    init_db()
+    init_ai_services()
+    if not ai_services.collection or not ai_services.embeddings:
+        print("ChromaDB/OpenAI non configurati (ENABLE_AI_PROCESSING, OPENAI_API_KEY): niente da fare")
+        return 1
+
+    checkpoint_path = Path(args.checkpoint)
+    filters = {"tenant": args.tenant, "productLine": args.product_line}
+    if args.recreate:
+        if args.tenant or args.product_line:
+            print("--recreate svuota l'intera collection: non si può combinare con --tenant/--product-line")
+            return 2
+        recreate_rag_collection()
+        print(f"Collection {ai_services.collection.name} ricreata vuota")
+    state = {} if args.restart or args.recreate else load_checkpoint(checkpoint_path)
+    if state and state.get("filters") != filters:
+        print(f"Checkpoint {checkpoint_path} di una run con filtri diversi ({state.get('filters')}): riparto da zero")
+        state = {}
+    if state.get("done"):
+        print(f"Checkpoint {checkpoint_path} già completato: usa --restart per una nuova run")
+        return 0
+    totals = state.get("totals") or {"reports": 0, "chunks": 0, "embedded": 0, "unchanged": 0, "deleted": 0, "tokens": 0}
+    after_id = state.get("last_id")
+    if after_id:
+        print(f"Ripresa dal checkpoint: {totals['reports']} report già elaborati, ultimo id {after_id}")
+
+    counters = {"tokens": 0}
+    started = time.monotonic()
+    run_chunks = run_embedded = run_tokens = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel), thread_name_prefix="reindex") as pool:
+        embed = parallel_embedder(args.batch_size, max(1, args.parallel), pool, counters)
+        while True:
+            page = fetch_page(after_id, args.page_size, args.tenant, args.product_line)
+            if not page:
+                break
+            chunks = []
+            for r in page:
+                chunks.extend(report_chunks(
+                    r["id"], r["executive_summary"], r["ci_summary"] or "",
+                    r["week_id"], r["tenant_id"] or "", r["product_line_id"],
+                ))
+            counters["tokens"] = 0
+            stats = sync_report_chunks([r["id"] for r in page], chunks, embed=embed)
+            if qa_cache and (stats["embedded"] or stats["deleted"]):
+                # le risposte in cache del Q&A per gli scope toccati non sono più valide
+                for scope in {(r["tenant_id"] or "", r["product_line_id"]) for r in page}:
+                    qa_cache.invalidate(*scope)
+
+            after_id = page[-1]["id"]
+            totals["reports"] += len(page)
+            totals["tokens"] += counters["tokens"]
+            for key in ("chunks", "embedded", "unchanged", "deleted"):
+                totals[key] += stats[key]
+            run_chunks += stats["chunks"]
+            run_embedded += stats["embedded"]
+            run_tokens += counters["tokens"]
+            save_checkpoint(checkpoint_path, {"last_id": after_id, "filters": filters, "totals": totals, "done": False})
+
+            elapsed = max(time.monotonic() - started, 1e-6)
+            print(
+                f"{totals['reports']} report | page: {stats['chunks']} chunk, {stats['embedded']} embedded, "
+                f"{stats['unchanged']} unchanged, {stats['deleted']} deleted | "
+                f"{run_chunks / elapsed:.1f} chunk/s, {run_embedded / elapsed:.1f} embedded/s, "
+                f"~{run_tokens / elapsed:.0f} token/s"
+            )
+
+    save_checkpoint(checkpoint_path, {"last_id": after_id, "filters": filters, "totals": totals, "done": True})
+    elapsed = time.monotonic() - started
+    print()
+    print(
+        f"Reindex completato in {elapsed:.1f}s: {totals['reports']} report, {totals['chunks']} chunk "
+        f"({totals['embedded']} embedded, {totals['unchanged']} invariati, {totals['deleted']} eliminati), "
+        f"~{totals['tokens']} token"
+    )
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ricostruisce l'indice RAG dai WeeklyReport")
+    parser.add_argument("--page-size", type=int, default=100, help="report letti dal DB per pagina")
+    parser.add_argument("--batch-size", type=int, default=256, help="chunk per chiamata di embedding")
+    parser.add_argument("--parallel", type=int, default=4, help="chiamate di embedding concorrenti")
+    parser.add_argument("--tenant", help="solo i report di questo tenant")
+    parser.add_argument("--product-line", help="solo i report di questa linea")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="file di checkpoint per la ripresa")
+    parser.add_argument("--restart", action="store_true", help="ignora il checkpoint e riparte da zero")
+    parser.add_argument("--recreate", action="store_true",
+                        help="elimina e ricrea la collection del modello corrente prima del backfill (implica "
+                             "--restart); il Q&A vede un indice parziale fino alla fine della run")
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,16 @@ from processing_queue import start_worker_once
 from ai_services import init_ai_services
 
 
+class StreamingAwareGZipMiddleware(GZipMiddleware):
+    """GZip buffers small writes: Server-Sent Events endpoints (*/stream) stay uncompressed."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 app = FastAPI(title="React Field Insights API", version="1.0.0", openapi_url="/v1/openapi.json")
 app.include_router(auth.router, prefix="/v1")
 app.include_router(upload.router, prefix="/v1")
@@ -33,14 +43,15 @@ app.add_middleware(
 
 if settings.TRUSTED_HOSTS and settings.TRUSTED_HOSTS != ["*"]:
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=settings.TRUSTED_HOSTS)
-app.add_middleware(GZipMiddleware, minimum_size=1024)
+app.add_middleware(StreamingAwareGZipMiddleware, minimum_size=1024)
 
 
 @app.on_event("startup")
 def on_startup():
     init_db()
     init_ai_services()
-    start_worker_once()
+    if settings.PROCESSING_EMBEDDED_WORKERS:
+        start_worker_once()
 
 
 @app.get("/healthz")
@@ -0,0 +1,155 @@
+"""
+Content-addressed cache for text derived from media (OCR, transcriptions).
+
+Entries are keyed by SHA-256 of the media bytes plus a version string describing
+the model/config that produced the text, stored as small files on local disk and
+evicted least-recently-used when the directory exceeds MEDIA_CACHE_MAX_MB.
+
+Transcriptions are cached as Whisper returned them, before anonymize_text (which runs
+on the merged insight text), so the cache holds personal data: every entry is deleted
+MEDIA_CACHE_TTL_HOURS after it was written, whether or not it is still being hit.
+File mtime is the write time (TTL), atime the last hit (LRU).
+get/put touch the disk (put may walk the whole directory to evict): call them from
+a thread, e.g. ai_services.run_blocking, never directly on the event loop.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MediaCache:
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: int):
+        self.root = Path(path)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None  # computed lazily from disk
+        self._purged_at = 0.0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def key(data: bytes, version: str) -> str:
+        return MediaCache.key_from_digest(hashlib.sha256(data).hexdigest(), version)
+
+    @staticmethod
+    def key_from_digest(sha256_hex: str, version: str) -> str:
+        """Key from a digest computed while streaming the media"""
+        return hashlib.sha256(f"{sha256_hex}:{version}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.txt"
+
+    def _entries(self):
+        return [p for p in self.root.glob("*/*.txt") if p.is_file()]
+
+    def _expired(self, st: os.stat_result, now: float) -> bool:
+        return now - st.st_mtime > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        now = time.time()
+        try:
+            st = path.stat()
+            if self._expired(st, now):
+                path.unlink()
+                with self._lock:
+                    self.stats["expired"] += 1
+                    if self._size is not None:
+                        self._size -= st.st_size
+                raise FileNotFoundError(path)
+            text = path.read_text(encoding="utf-8")
+            os.utime(path, (now, st.st_mtime))  # atime = last hit for LRU, mtime stays the write time
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        path = self._path(key)
+        data = text.encode("utf-8")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # atomic write: concurrent workers never read a partial entry
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.stats["stores"] += 1
+        with self._lock:
+            if self._size is None:
+                self._size = sum(p.stat().st_size for p in self._entries())
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def purge_expired(self, min_interval: float = 600.0) -> int:
+        """Delete entries older than the TTL, at most once per min_interval seconds.
+        Called periodically so entries that are never hit again do not outlive the TTL."""
+        now = time.time()
+        with self._lock:
+            if now - self._purged_at < min_interval:
+                return 0
+            self._purged_at = now
+            removed = 0
+            for p in self._entries():
+                try:
+                    st = p.stat()
+                    if self._expired(st, now):
+                        p.unlink()
+                        removed += 1
+                        if self._size is not None:
+                            self._size -= st.st_size
+                except FileNotFoundError:
+                    continue
+            self.stats["expired"] += removed
+        if removed:
+            logger.info(f"Media cache: {removed} expired entries deleted")
+        return removed
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is at 90% of its budget"""
+        entries = []
+        for p in self._entries():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_atime, st.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                self.stats["evictions"] += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, sizeBytes=self._size, maxBytes=self.max_bytes, ttlSeconds=self.ttl_seconds)
+
+
+media_cache: Optional[MediaCache] = (
+    MediaCache(settings.MEDIA_CACHE_PATH, settings.MEDIA_CACHE_MAX_MB * 1024 * 1024,
+               settings.MEDIA_CACHE_TTL_HOURS * 3600)
+    if settings.MEDIA_CACHE_ENABLED else None
+)
+
+
+def get_media_cache_stats() -> Dict[str, Any]:
+    return media_cache.get_stats() if media_cache else {"enabled": False}
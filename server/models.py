@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, JSON
+from sqlalchemy import Column, String, Text, DateTime, JSON, Integer, Float, Index, UniqueConstraint, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 import uuid
@@ -14,6 +14,7 @@ class Tenant(Base):
     id = Column(String, primary_key=True, default=uuid_str)
     name = Column(String, nullable=False, unique=True)
     company_code = Column(String, nullable=True, unique=True)
+    ai_config = Column(JSON, nullable=True)  # override per-tenant della pipeline AI (es. sentimentTier)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
@@ -91,3 +92,62 @@ class WeeklyReport(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class ProcessingJob(Base):
+    __tablename__ = "processing_job"
+    id = Column(String, primary_key=True, default=uuid_str)
+    insight_id = Column(String, nullable=False, index=True)
+    tenant_id = Column(String, nullable=True, index=True)
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    priority = Column(Integer, nullable=False, default=0)  # lane: 0 text, 1 image, 2 audio (più bassi serviti prima)
+    virtual_time = Column(Float, nullable=False, default=0.0)  # tag del fair queuing per tenant, dentro la lane
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_processing_job_claim", "status", "priority", "virtual_time"),
+        # al massimo un job attivo per insight, anche con sweep di avvio concorrenti
+        Index(
+            "uq_processing_job_active_insight",
+            "insight_id",
+            unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+
+class AIResultCacheEntry(Base):
+    __tablename__ = "ai_result_cache"
+    key = Column(String, primary_key=True)  # sha256(kind, modello, versione prompt, testo normalizzato)
+    kind = Column(String, nullable=False)  # sentiment, ocr_enhance, ...
+    value = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    last_used_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_key"
+    id = Column(String, primary_key=True, default=uuid_str)
+    scope = Column(String, nullable=False)  # "tenant_id:user_id", "-" dove manca
+    key = Column(String, nullable=False)  # header Idempotency-Key
+    fingerprint = Column(String, nullable=False)  # sha256(endpoint, body): stessa chiave con body diverso = errore
+    status_code = Column(Integer, nullable=False)
+    response = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint("scope", "key", name="uq_idempotency_key_scope_key"),
+    )
+
+
+class QAIndexVersion(Base):
+    __tablename__ = "qa_index_version"
+    scope = Column(String, primary_key=True)  # "tenant|product_line", "*" = tutti
+    version = Column(Integer, nullable=False, default=0)  # incrementata a ogni report indicizzato nello scope
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
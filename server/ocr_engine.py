@@ -0,0 +1,234 @@
+"""
+OCR engine: Tesseract runs in a process pool sized to the machine so that
+photo-heavy uploads use every core and never block the event loop.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Dict, Any, Union
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {"pending": 0, "completed": 0, "failed": 0, "timeouts": 0, "pool_crashes": 0}
+# one slot per pool process, per event loop: images wait here, not in the pool's queue
+_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: the API process is multi-threaded, forking it is not safe
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.OCR_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"OCR process pool started with {settings.OCR_PROCESSES} processes")
+        return _executor
+
+
+def _discard_broken_executor(broken: ProcessPoolExecutor) -> bool:
+    """A pool process died (OOM on a huge image, segfault): the pool is unusable for good,
+    drop it so the next image starts a fresh one. Only the broken instance is dropped,
+    concurrent failures on the same pool restart it once. True if this call dropped it."""
+    global _executor
+    with _executor_lock:
+        if _executor is not broken:
+            return False
+        _executor = None
+    logger.error("OCR process pool broken (a process died), restarting it")
+    broken.shutdown(wait=False, cancel_futures=True)
+    return True
+
+
+def _pool_slot(loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+    slot = _slots.get(loop)
+    if slot is None:
+        slot = _slots[loop] = asyncio.Semaphore(settings.OCR_PROCESSES)
+    return slot
+
+
+def _otsu_threshold(gray) -> int:
+    """Otsu threshold from the 256-bin histogram of a grayscale image"""
+    hist = gray.histogram()
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    sum_bg = weight_bg = 0
+    best_t, best_var = 127, -1.0
+    for t in range(256):
+        weight_bg += hist[t]
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * hist[t]
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        var = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if var > best_var:
+            best_t, best_var = t, var
+    return best_t
+
+
+def _skew_angle(binary, max_angle: float = 5.0, step: float = 0.5) -> float:
+    """
+    Estimate text skew with a projection profile on a small copy: the angle whose
+    row sums have the highest variance is the one where text lines are horizontal.
+    """
+    from PIL import Image
+
+    small = binary.copy()
+    small.thumbnail((800, 800))
+    ink = small.point(lambda p: 255 - p)  # text becomes white: rotation fills with black
+    best_angle, best_score = 0.0, -1.0
+    angle = -max_angle
+    while angle <= max_angle + 1e-9:
+        rotated = ink.rotate(angle, resample=Image.BILINEAR, expand=False)
+        profile = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(profile) / len(profile)
+        score = sum((v - mean) ** 2 for v in profile)
+        if score > best_score:
+            best_angle, best_score = angle, score
+        angle += step
+    return best_angle
+
+
+def preprocess_image(image, max_side: int = 2000, binarize: bool = True,
+                     deskew: bool = True, crop: bool = False):
+    """
+    Prepare a phone photo for Tesseract: EXIF rotation, downscale so the long side
+    is at most max_side (2000 px is ~170 DPI for a full-frame A4 page, enough for brochure
+    type; 3508 px would be 300 DPI but barely shrinks a 12MP photo), grayscale, Otsu
+    binarization, deskew and an optional crop to the text bounding box. The output never
+    exceeds max_side, deskew included.
+    """
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    scale = max_side / max(image.size)
+    if scale < 1:
+        image = image.resize(
+            (max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS
+        )
+    gray = ImageOps.autocontrast(ImageOps.grayscale(image))
+    if binarize:
+        threshold = _otsu_threshold(gray)
+        gray = gray.point(lambda p: 255 if p > threshold else 0)
+    if deskew:
+        angle = _skew_angle(gray)
+        if abs(angle) >= 0.5:
+            gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+            # expand=True grows the canvas by up to sin(angle) of the other side: back within max_side
+            scale = max_side / max(gray.size)
+            if scale < 1:
+                gray = gray.resize(
+                    (max(1, int(gray.width * scale)), max(1, int(gray.height * scale))), Image.LANCZOS
+                )
+                if binarize:
+                    gray = gray.point(lambda p: 255 if p > 127 else 0)
+    if crop:
+        bbox = gray.point(lambda p: 255 - p).getbbox()
+        if bbox:
+            margin = 20
+            gray = gray.crop((
+                max(0, bbox[0] - margin),
+                max(0, bbox[1] - margin),
+                min(gray.width, bbox[2] + margin),
+                min(gray.height, bbox[3] + margin),
+            ))
+    return gray
+
+
+def preprocess_options() -> Optional[Dict[str, Any]]:
+    """Preprocessing options from settings (None = feed the raw image to Tesseract)"""
+    if not settings.OCR_PREPROCESS:
+        return None
+    return {
+        "max_side": settings.OCR_MAX_SIDE,
+        "binarize": settings.OCR_BINARIZE,
+        "deskew": settings.OCR_DESKEW,
+        "crop": settings.OCR_CROP_TEXT,
+    }
+
+
+def tesseract_ocr(source: Union[str, bytes], lang: str, config: str,
+                  tesseract_cmd: Optional[str], timeout: int,
+                  preprocess: Optional[Dict[str, Any]] = None) -> str:
+    """Open, preprocess and OCR an image. Runs inside a pool process (or inline for scripts)"""
+    import io
+    import pytesseract
+    from PIL import Image
+
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    if preprocess is not None:
+        image = preprocess_image(image, **preprocess)
+    # timeout kills the tesseract subprocess itself, not just our wait
+    return pytesseract.image_to_string(image, lang=lang, config=config, timeout=timeout).strip()
+
+
+async def run_ocr(source: Union[str, bytes], lang: str = "ita+eng", config: str = "--psm 6") -> str:
+    """
+    OCR an image (file path or raw bytes) on the process pool.
+    Raises asyncio.TimeoutError if the image takes longer than OCR_TIMEOUT_SECONDS
+    once a process is free; time spent waiting for a free process does not count.
+    """
+    loop = asyncio.get_running_loop()
+    timeout = settings.OCR_TIMEOUT_SECONDS
+    with _stats_lock:
+        _stats["pending"] += 1
+    try:
+        async with _pool_slot(loop):
+            executor = _get_executor()
+            future = loop.run_in_executor(
+                executor, tesseract_ocr, source, lang, config, settings.TESSERACT_CMD, timeout,
+                preprocess_options(),
+            )
+            # the process is free, so the deadline only covers decode/preprocess + tesseract;
+            # the grace period is for spawning a worker process on first use
+            text = await asyncio.wait_for(future, timeout + 5)
+        with _stats_lock:
+            _stats["completed"] += 1
+        return text
+    except BrokenProcessPool:
+        crashed = _discard_broken_executor(executor)
+        with _stats_lock:
+            _stats["failed"] += 1
+            _stats["pool_crashes"] += int(crashed)
+        raise
+    except (asyncio.TimeoutError, RuntimeError) as e:
+        if isinstance(e, asyncio.TimeoutError) or "timeout" in str(e).lower():
+            with _stats_lock:
+                _stats["timeouts"] += 1
+            raise asyncio.TimeoutError(f"OCR timed out after {timeout}s") from e
+        with _stats_lock:
+            _stats["failed"] += 1
+        raise
+    except Exception:
+        with _stats_lock:
+            _stats["failed"] += 1
+        raise
+    finally:
+        with _stats_lock:
+            _stats["pending"] -= 1
+
+
+def get_ocr_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["processes"] = settings.OCR_PROCESSES
+    # images waiting for a free process (pending includes those being OCR'd)
+    stats["queueDepth"] = max(0, stats["pending"] - settings.OCR_PROCESSES)
+    return stats
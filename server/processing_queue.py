@@ -1,36 +1,576 @@
+import asyncio
+import os
+import socket
 import threading
-import queue
-from typing import Optional
+import time
+import logging
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Tuple, List, Iterable
+from sqlalchemy import event, func, update, exists, and_, case
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from .db import get_session
-from .processing_worker import process_insight
+from .config import settings
+from .db import SessionLocal, engine, init_db
+from .models import InsightRaw, ProcessingJob
+from .media_cache import media_cache
+from .processing_worker import process_insight_async, get_worker_loop
 
+logger = logging.getLogger(__name__)
 
-_q: "queue.Queue[str]" = queue.Queue()
+# La coda vive nella tabella processing_job: ogni replica API (o processo worker dedicato)
+# esegue sul loop persistente del worker N task async che si contendono i job tramite lease.
+# Su Postgres il claim usa SELECT ... FOR UPDATE SKIP LOCKED, su SQLite un compare-and-set.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_wakeup: Optional[asyncio.Event] = None
 _worker_started = False
+_start_lock = threading.Lock()
+_worker_stats: Dict[int, Dict[str, Any]] = {}
+_owner_prefix = f"{socket.gethostname()}:{os.getpid()}"
 
+# Classi di priorità: ProcessingJob.priority è l'indice della lane. Ogni lane ha i suoi worker,
+# che servono prima la propria lane e solo quando è vuota aiutano le lane più veloci (i worker
+# audio prendono immagini e testo, quelli immagine il testo). Un job non gira mai sui worker
+# di una lane più veloce: un insight solo testo non aspetta dietro a un backlog di audio, e
+# l'audio ha comunque capacità propria anche con traffico testuale continuo.
+LANES = ("text", "image", "audio")
+LANE_TEXT, LANE_IMAGE, LANE_AUDIO = range(len(LANES))
+_lane_latencies: Dict[int, "deque[float]"] = {lane: deque(maxlen=500) for lane in range(len(LANES))}
 
-def _worker_loop():
+
+def lane_for(audio_url: Optional[str], photo_url: Optional[str]) -> int:
+    """Lane (= priority) di un insight in base al media più lento che contiene."""
+    if audio_url:
+        return LANE_AUDIO
+    if photo_url:
+        return LANE_IMAGE
+    return LANE_TEXT
+
+
+def lane_workers() -> List[int]:
+    """PROCESSING_LANE_WORKERS ("text=2,image=1,audio=1") -> worker per lane, nell'ordine di LANES."""
+    counts = [0] * len(LANES)
+    for part in settings.PROCESSING_LANE_WORKERS.split(","):
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in LANES:
+            logger.warning(f"Unknown processing lane '{name}' in PROCESSING_LANE_WORKERS")
+            continue
+        counts[LANES.index(name)] = max(0, int(value or 0))
+    if not counts[LANE_TEXT]:
+        counts[LANE_TEXT] = 1  # la fast path testuale deve sempre avere almeno un worker
+    return counts
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _lease_deadline() -> datetime:
+    return _utcnow() + timedelta(seconds=settings.PROCESSING_LEASE_SECONDS)
+
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for part in spec.split(","):
+        tenant_id, _, value = part.partition("=")
+        if tenant_id.strip() and value.strip():
+            weights[tenant_id.strip()] = float(value)
+    return weights
+
+
+_tenant_weights = _parse_weights(settings.PROCESSING_TENANT_WEIGHTS)
+
+
+def tenant_weight(tenant_id: Optional[str]) -> float:
+    weight = _tenant_weights.get(tenant_id or "", settings.PROCESSING_DEFAULT_TENANT_WEIGHT)
+    return max(weight, 0.001)
+
+
+def _assign_virtual_times(session: Session, items: Iterable[Tuple[Optional[str], int]]) -> List[float]:
+    """Start-time fair queuing dentro ogni lane: un job riceve il tag
+    max(V, ultimo tag in coda del suo tenant) + 1/peso, dove V è il tag minimo in coda
+    nella lane. I worker servono i tag in ordine crescente, quindi un tenant che importa
+    migliaia di insight si mette in fila dietro ai propri job, non davanti a quelli altrui.
+    items: (tenant_id, lane) per ogni job da accodare; ritorna i tag nello stesso ordine."""
+    floors: Dict[int, float] = {}
+    last: Dict[Tuple[Optional[str], int], float] = {}
+    tags = []
+    for tenant_id, lane in items:
+        if lane not in floors:
+            floors[lane] = session.query(func.min(ProcessingJob.virtual_time)).filter(
+                ProcessingJob.status == "queued", ProcessingJob.priority == lane
+            ).scalar() or 0.0
+        key = (tenant_id, lane)
+        if key not in last:
+            tenant_filter = (
+                ProcessingJob.tenant_id == tenant_id if tenant_id is not None else ProcessingJob.tenant_id.is_(None)
+            )
+            last[key] = session.query(func.max(ProcessingJob.virtual_time)).filter(
+                ProcessingJob.status == "queued", ProcessingJob.priority == lane, tenant_filter
+            ).scalar() or 0.0
+        tag = max(floors[lane], last[key]) + 1.0 / tenant_weight(tenant_id)
+        last[key] = tag
+        tags.append(tag)
+    return tags
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite restituisce datetime naive: sono in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _claim_job(owner: str, lane: int = LANE_AUDIO) -> Optional[Tuple[str, str, int, datetime, int]]:
+    """Prende in lease il prossimo job in coda per un worker della lane indicata: prima la
+    propria lane, poi le lane più veloci (< lane), le più urgenti prima; dentro la lane in
+    ordine di virtual_time (fair queuing tra tenant).
+    Ritorna (job_id, insight_id, lane, created_at, attempts) o None; attempts include questo."""
+    session = SessionLocal()
+    try:
+        q = (
+            session.query(
+                ProcessingJob.id,
+                ProcessingJob.insight_id,
+                ProcessingJob.priority,
+                ProcessingJob.created_at,
+                ProcessingJob.attempts,
+            )
+            .filter(ProcessingJob.status == "queued", ProcessingJob.priority <= lane)
+            .order_by(
+                case((ProcessingJob.priority == lane, 0), else_=1),
+                ProcessingJob.priority,
+                ProcessingJob.virtual_time,
+                ProcessingJob.created_at,
+            )
+        )
+        if engine.dialect.name == "postgresql":
+            row = q.with_for_update(skip_locked=True).first()
+            if not row:
+                session.rollback()
+                return None
+            candidates = [row]
+        else:
+            candidates = q.limit(5).all()
+        for job_id, insight_id, job_lane, created_at, attempts in candidates:
+            claimed = session.execute(
+                update(ProcessingJob)
+                .where(ProcessingJob.id == job_id, ProcessingJob.status == "queued")
+                .values(
+                    status="running",
+                    attempts=ProcessingJob.attempts + 1,
+                    lease_owner=owner,
+                    lease_expires_at=_lease_deadline(),
+                )
+            )
+            if claimed.rowcount == 1:
+                session.commit()
+                return job_id, insight_id, job_lane, created_at, attempts + 1
+        session.rollback()
+        return None
+    finally:
+        session.close()
+
+
+def _renew_lease(job_id: str, owner: str):
+    session = SessionLocal()
+    try:
+        session.execute(
+            update(ProcessingJob)
+            .where(ProcessingJob.id == job_id, ProcessingJob.lease_owner == owner)
+            .values(lease_expires_at=_lease_deadline())
+        )
+        session.commit()
+    finally:
+        session.close()
+
+
+def _finish_job(job_id: str, owner: str, error: Optional[str] = None):
+    session = SessionLocal()
+    try:
+        job = session.get(ProcessingJob, job_id)
+        if not job or job.lease_owner != owner:
+            # lease scaduto e ripreso da un altro worker
+            return
+        if error is None:
+            job.status = "done"
+        elif job.attempts < settings.PROCESSING_MAX_ATTEMPTS:
+            job.status = "queued"
+        else:
+            job.status = "failed"
+        job.last_error = error
+        job.lease_owner = None
+        job.lease_expires_at = None
+        session.commit()
+    finally:
+        session.close()
+
+
+def requeue_expired_leases() -> int:
+    """Rimette in coda i job il cui worker è morto senza rilasciare il lease.
+    Chi ha esaurito i tentativi (es. worker OOM ogni volta sulla stessa foto) passa a failed
+    e l'errore viene scritto in extracted, come fa il worker all'ultimo tentativo: altrimenti
+    lo sweep di avvio lo vedrebbe ancora da estrarre e lo rimetterebbe in coda a ogni restart."""
+    session = SessionLocal()
+    try:
+        expired = and_(ProcessingJob.status == "running", ProcessingJob.lease_expires_at < _utcnow())
+        exhausted = (
+            session.query(ProcessingJob.id, ProcessingJob.insight_id)
+            .filter(expired, ProcessingJob.attempts >= settings.PROCESSING_MAX_ATTEMPTS)
+            .all()
+        )
+        if exhausted:
+            session.execute(
+                update(ProcessingJob)
+                .where(ProcessingJob.id.in_([job_id for job_id, _ in exhausted]), expired)
+                .values(status="failed", lease_owner=None, lease_expires_at=None, last_error="lease expired")
+            )
+            session.execute(
+                update(InsightRaw)
+                .where(InsightRaw.id.in_([insight_id for _, insight_id in exhausted]), InsightRaw.extracted.is_(None))
+                .values(extracted={"sentiment": "neutral", "error": "lease expired"})
+            )
+        res = session.execute(
+            update(ProcessingJob)
+            .where(expired)
+            .values(status="queued", lease_owner=None, lease_expires_at=None)
+        )
+        session.commit()
+        return res.rowcount or 0
+    finally:
+        session.close()
+
+
+def recover_unprocessed() -> int:
+    """Sweep di avvio: accoda gli insight mai estratti che non hanno un job attivo.
+    Più repliche possono farlo insieme: l'indice unico parziale sui job attivi fa fallire
+    chi arriva secondo, che riprova vedendo i job appena creati dall'altro."""
+    for attempt in range(3):
+        try:
+            return _recover_unprocessed_once()
+        except IntegrityError:
+            logger.info("Concurrent startup sweep detected, retrying")
+    return 0
+
+
+def _recover_unprocessed_once() -> int:
+    session = SessionLocal()
+    try:
+        active = exists().where(
+            ProcessingJob.insight_id == InsightRaw.id,
+            ProcessingJob.status.in_(("queued", "running")),
+        )
+        rows = (
+            session.query(InsightRaw.id, InsightRaw.tenant_id, InsightRaw.audio_url, InsightRaw.photo_url)
+            .filter(InsightRaw.extracted.is_(None), ~active)
+            .order_by(InsightRaw.created_at)
+            .all()
+        )
+        ids = [r[0] for r in rows]
+        items = [(tenant_id, lane_for(audio_url, photo_url)) for _, tenant_id, audio_url, photo_url in rows]
+        for (insight_id, tenant_id, _, _), (_, lane), tag in zip(rows, items, _assign_virtual_times(session, items)):
+            session.add(ProcessingJob(insight_id=insight_id, tenant_id=tenant_id, priority=lane, virtual_time=tag))
+        session.commit()
+        if ids:
+            logger.info(f"Recovered {len(ids)} unprocessed insights")
+        return len(ids)
+    except IntegrityError:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+async def _keep_lease(job_id: str, owner: str):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(settings.PROCESSING_LEASE_SECONDS / 3)
+        try:
+            await loop.run_in_executor(None, _renew_lease, job_id, owner)
+        except Exception as e:
+            # un errore transitorio del DB non deve fermare l'heartbeat: al prossimo giro
+            # si riprova, il lease dura ancora 2/3 del suo tempo
+            logger.warning(f"Could not renew lease of job {job_id}: {e}")
+
+
+async def _wait_for_work():
+    _wakeup.clear()
+    try:
+        await asyncio.wait_for(_wakeup.wait(), settings.PROCESSING_POLL_SECONDS)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def _worker_task(worker_id: int, lane: int):
+    loop = asyncio.get_running_loop()
+    stats = _worker_stats[worker_id]
+    owner = f"{_owner_prefix}:{worker_id}"
     while True:
-        insight_id = _q.get()
         try:
-            session: Session = next(get_session())
-            process_insight(session, insight_id)
-        except Exception:
-            pass
+            claimed = await loop.run_in_executor(None, _claim_job, owner, lane)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} could not claim a job: {e}")
+            claimed = None
+        if not claimed:
+            await _wait_for_work()
+            continue
+        job_id, insight_id, job_lane, created_at, attempts = claimed
+        stats["current"] = insight_id
+        started = time.monotonic()
+        heartbeat = loop.create_task(_keep_lease(job_id, owner))
+        session = SessionLocal()
+        error = None
+        try:
+            final_attempt = attempts >= settings.PROCESSING_MAX_ATTEMPTS
+            await process_insight_async(session, insight_id, final_attempt=final_attempt)
+            stats["processed"] += 1
+        except Exception as e:
+            error = str(e)
+            stats["failed"] += 1
+            logger.error(f"Worker {worker_id} failed on insight {insight_id}: {e}")
         finally:
-            _q.task_done()
+            heartbeat.cancel()
+            session.close()
+            elapsed = time.monotonic() - started
+            stats["current"] = None
+            stats["last_duration_s"] = round(elapsed, 3)
+            stats["busy_s"] = round(stats["busy_s"] + elapsed, 3)
+        if error is None and created_at is not None:
+            # enqueue -> extracted, inclusa l'attesa in coda
+            _lane_latencies[job_lane].append((_utcnow() - _aware(created_at)).total_seconds())
+        try:
+            await loop.run_in_executor(None, _finish_job, job_id, owner, error)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} could not release job {job_id}: {e}")
+
+
+async def _reaper_task():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(settings.PROCESSING_LEASE_SECONDS / 2)
+        try:
+            if await loop.run_in_executor(None, requeue_expired_leases):
+                _wakeup.set()
+        except Exception as e:
+            logger.error(f"Lease reaper failed: {e}")
+        if media_cache:
+            # le voci scadute vanno cancellate anche se nessuno le richiede più (TTL per GDPR)
+            try:
+                await loop.run_in_executor(None, media_cache.purge_expired)
+            except Exception as e:
+                logger.error(f"Media cache purge failed: {e}")
+
+
+async def _start_pool():
+    global _wakeup
+    _wakeup = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    worker_id = 0
+    for lane, count in enumerate(lane_workers()):
+        for _ in range(count):
+            _worker_stats[worker_id] = {
+                "lane": LANES[lane],
+                "processed": 0,
+                "failed": 0,
+                "current": None,
+                "last_duration_s": None,
+                "busy_s": 0.0,
+            }
+            loop.create_task(_worker_task(worker_id, lane))
+            worker_id += 1
+    loop.create_task(_reaper_task())
 
 
 def start_worker_once():
-    global _worker_started
-    if _worker_started:
+    global _worker_started, _loop
+    with _start_lock:
+        if _worker_started:
+            return
+        requeue_expired_leases()
+        recover_unprocessed()
+        loop = get_worker_loop()
+        asyncio.run_coroutine_threadsafe(_start_pool(), loop).result()
+        _loop = loop
+        _worker_started = True
+    logger.info(
+        f"Processing pool started: {len(_worker_stats)} workers "
+        f"({settings.PROCESSING_LANE_WORKERS}), {settings.PROCESSING_THREADS} threads"
+    )
+
+
+def notify_workers():
+    """Sveglia i worker locali senza attendere il prossimo poll."""
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+def enqueue_insight(insight_id: str, session: Optional[Session] = None, priority: int = LANE_TEXT,
+                    tenant_id: Optional[str] = None):
+    """Accoda un insight nella lane indicata (vedi lane_for). Con una sessione esterna il job
+    entra nella stessa transazione dell'insight e i worker vengono svegliati al commit."""
+    if session is None:
+        own = SessionLocal()
+        try:
+            enqueue_insights(own, [(insight_id, tenant_id, priority)])
+            own.commit()
+        finally:
+            own.close()
         return
-    t = threading.Thread(target=_worker_loop, daemon=True)
-    t.start()
-    _worker_started = True
+    enqueue_insights(session, [(insight_id, tenant_id, priority)])
+
+
+def enqueue_insights(session: Session, jobs: List[Tuple[str, Optional[str], int]]):
+    """Accoda in blocco (insight_id, tenant_id, lane) nella transazione della sessione:
+    tag di fair queuing calcolati una volta per tenant/lane, un solo INSERT multi-riga."""
+    if not jobs:
+        return
+    tags = _assign_virtual_times(session, [(tenant_id, lane) for _, tenant_id, lane in jobs])
+    session.add_all([
+        ProcessingJob(insight_id=insight_id, tenant_id=tenant_id, priority=lane, virtual_time=tag)
+        for (insight_id, tenant_id, lane), tag in zip(jobs, tags)
+    ])
+    event.listen(session, "after_commit", lambda _s: notify_workers(), once=True)
+
+
+# Admission control: profondità del backlog e throughput recente letti dal DB (quindi
+# validi per tutte le repliche), in cache per un secondo per non fare due COUNT a richiesta.
+_BACKLOG_TTL_SECONDS = 1.0
+_THROUGHPUT_WINDOW_SECONDS = 300
+_backlog_snapshot: Dict[str, Any] = {"at": 0.0, "queued": {}, "throughput": 0.0}
+_backlog_lock = threading.Lock()
+
+
+def backlog_snapshot() -> Dict[str, Any]:
+    """{"queued": {lane: job in coda}, "throughput": job completati/s negli ultimi 5 minuti}"""
+    with _backlog_lock:
+        if time.monotonic() - _backlog_snapshot["at"] < _BACKLOG_TTL_SECONDS:
+            return _backlog_snapshot
+    session = SessionLocal()
+    try:
+        queued = dict(
+            session.query(ProcessingJob.priority, func.count(ProcessingJob.id))
+            .filter(ProcessingJob.status == "queued")
+            .group_by(ProcessingJob.priority)
+            .all()
+        )
+        since = _utcnow() - timedelta(seconds=_THROUGHPUT_WINDOW_SECONDS)
+        done = session.query(func.count(ProcessingJob.id)).filter(
+            ProcessingJob.status == "done", ProcessingJob.updated_at >= since
+        ).scalar() or 0
+    finally:
+        session.close()
+    with _backlog_lock:
+        _backlog_snapshot.update(at=time.monotonic(), queued=queued, throughput=done / _THROUGHPUT_WINDOW_SECONDS)
+        return _backlog_snapshot
+
+
+def backlog_depth() -> int:
+    return sum(backlog_snapshot()["queued"].values())
+
+
+def estimate_wait_seconds(lane: int = LANE_TEXT) -> Optional[float]:
+    """Stima grezza del tempo prima che un nuovo job della lane venga completato:
+    job in coda nelle lane servite prima / throughput recente. None senza storico."""
+    snapshot = backlog_snapshot()
+    if not snapshot["throughput"]:
+        return None
+    ahead = sum(n for job_lane, n in snapshot["queued"].items() if job_lane <= lane)
+    return round((ahead + 1) / snapshot["throughput"], 1)
+
+
+def retry_after_seconds() -> int:
+    """Retry-After per le richieste respinte: il tempo per smaltire l'eccesso di backlog."""
+    snapshot = backlog_snapshot()
+    excess = max(1, backlog_depth() - settings.PROCESSING_BACKLOG_MAX + 1)
+    if not snapshot["throughput"]:
+        return settings.PROCESSING_RETRY_AFTER_MAX_SECONDS
+    return int(min(settings.PROCESSING_RETRY_AFTER_MAX_SECONDS, max(1, excess / snapshot["throughput"])))
+
+
+def job_status(insight_id: str) -> Optional[Dict[str, Any]]:
+    """Stato dell'ultimo job di processing di un insight (None se mai accodato)."""
+    session = SessionLocal()
+    try:
+        job = (
+            session.query(ProcessingJob)
+            .filter(ProcessingJob.insight_id == insight_id)
+            .order_by(ProcessingJob.created_at.desc())
+            .first()
+        )
+        if job is None:
+            return None
+        return {
+            "status": job.status,
+            "lane": LANES[job.priority] if 0 <= job.priority < len(LANES) else str(job.priority),
+            "attempts": job.attempts,
+            "lastError": job.last_error,
+            "updatedAt": job.updated_at.isoformat() if job.updated_at else None,
+            "estimatedCompletionSeconds": estimate_wait_seconds(job.priority) if job.status == "queued" else None,
+        }
+    finally:
+        session.close()
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(pct * len(ordered)))], 3)
+
 
+def get_worker_stats() -> Dict[str, Any]:
+    session = SessionLocal()
+    try:
+        counts = (
+            session.query(ProcessingJob.status, ProcessingJob.priority, func.count(ProcessingJob.id))
+            .group_by(ProcessingJob.status, ProcessingJob.priority)
+            .all()
+        )
+        per_tenant = (
+            session.query(ProcessingJob.tenant_id, ProcessingJob.status, func.count(ProcessingJob.id))
+            .filter(ProcessingJob.status.in_(("queued", "running")))
+            .group_by(ProcessingJob.tenant_id, ProcessingJob.status)
+            .all()
+        )
+    finally:
+        session.close()
+    tenants: Dict[str, Dict[str, Any]] = {}
+    for tenant_id, status, n in per_tenant:
+        entry = tenants.setdefault(tenant_id or "none", {
+            "queued": 0, "running": 0, "weight": tenant_weight(tenant_id)
+        })
+        entry[status] = n
+    busiest = sorted(tenants.items(), key=lambda kv: kv[1]["queued"], reverse=True)[:50]
+    by_status: Dict[str, int] = {}
+    by_lane: Dict[Tuple[str, int], int] = {}
+    for status, lane, n in counts:
+        by_status[status] = by_status.get(status, 0) + n
+        by_lane[(status, lane)] = n
+    workers = lane_workers()
+    lanes = {}
+    for lane, name in enumerate(LANES):
+        latencies = list(_lane_latencies[lane])
+        lanes[name] = {
+            "workers": workers[lane] if _worker_started else 0,
+            "queued": by_lane.get(("queued", lane), 0),
+            "running": by_lane.get(("running", lane), 0),
+            "p50_s": _percentile(latencies, 0.5),
+            "p95_s": _percentile(latencies, 0.95),
+        }
+    return {
+        "workers": len(_worker_stats) if _worker_started else 0,
+        "threads": settings.PROCESSING_THREADS,
+        "jobs": {s: by_status.get(s, 0) for s in ("queued", "running", "done", "failed")},
+        "lanes": lanes,
+        "tenants": dict(busiest),
+        "backlogMax": settings.PROCESSING_BACKLOG_MAX,
+        "throughputPerSecond": round(backlog_snapshot()["throughput"], 3),
+        "perWorker": {str(k): dict(v) for k, v in _worker_stats.items()},
+    }
 
-def enqueue_insight(insight_id: str):
-    _q.put(insight_id)
 
+if __name__ == "__main__":
+    # Processo worker dedicato: python -m server.processing_queue
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    start_worker_once()
+    threading.Event().wait()
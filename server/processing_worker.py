@@ -1,12 +1,18 @@
 import re
 import asyncio
-from typing import Optional, Dict, Any
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Awaitable, List, TypeVar
 from sqlalchemy.orm import Session
-from .models import InsightRaw
+from .config import settings
+from .models import InsightRaw, Tenant
 from .ai_services import (
     transcribe_audio_real, 
     ocr_image_real, 
     analyze_sentiment_advanced,
+    analyze_sentiment_advanced_async,
+    sentiment_tier_config,
     init_ai_services
 )
 import logging
@@ -16,6 +22,40 @@ logger = logging.getLogger(__name__)
 # Initialize AI services
 init_ai_services()
 
+T = TypeVar("T")
+
+# Event loop unico per tutta la vita del processo worker: client HTTP e risorse async
+# condivise restano vive tra un insight e l'altro invece di essere ricreate ogni volta.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """Return the long-lived processing loop, starting its thread on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(
+                ThreadPoolExecutor(max_workers=settings.PROCESSING_THREADS, thread_name_prefix="processing")
+            )
+            t = threading.Thread(target=loop.run_forever, name="processing-loop", daemon=True)
+            t.start()
+            _loop = loop
+        return _loop
+
+
+def run_on_worker_loop(coro: Awaitable[T]) -> T:
+    """Run a coroutine on the processing loop from synchronous code and wait for it"""
+    loop = get_worker_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_on_worker_loop called from the processing loop: await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
 
 def anonymize_text(text: Optional[str]) -> Optional[str]:
     """Enhanced anonymization for GDPR compliance"""
@@ -41,33 +81,91 @@ def anonymize_text(text: Optional[str]) -> Optional[str]:
     return anon
 
 
-async def process_insight_async(session: Session, insight_id: str) -> None:
-    """Async processing with real AI services"""
+async def _run_media_stages(coros: List[Awaitable[Optional[str]]]) -> List[Optional[str]]:
+    """Run media stages with at most MEDIA_STAGE_CONCURRENCY in flight, results in input order"""
+    if not coros:
+        return []
+    sem = asyncio.Semaphore(max(1, settings.MEDIA_STAGE_CONCURRENCY))
+
+    async def bounded(coro):
+        async with sem:
+            return await coro
+
+    results = await asyncio.gather(*(bounded(c) for c in coros), return_exceptions=True)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return results
+
+
+def _load(session: Session, insight_id: str) -> Optional[Dict[str, Any]]:
+    """Blocking: the insight fields the pipeline needs plus the tenant's AI config"""
     ins = session.get(InsightRaw, insight_id)
+    if not ins:
+        return None
+    tenant = session.get(Tenant, ins.tenant_id) if ins.tenant_id else None
+    return {
+        "text": ins.text,
+        "audio_url": ins.audio_url,
+        "photo_url": ins.photo_url,
+        "ocr_text": ins.ocr_text,
+        "extracted": ins.extracted,
+        "ai_config": tenant.ai_config if tenant else None,
+    }
+
+
+def _save(session: Session, insight_id: str, **values: Any) -> None:
+    """Blocking: write the pipeline results on the insight and commit"""
+    ins = session.get(InsightRaw, insight_id)
+    for name, value in values.items():
+        setattr(ins, name, value)
+    session.commit()
+
+
+async def process_insight_async(session: Session, insight_id: str, final_attempt: bool = True) -> None:
+    """
+    Async processing with real AI services. Failures are re-raised so the queue can
+    retry the job; the error is written to `extracted` only on the final attempt.
+    Idempotent: an insight whose `extracted` is already set is left untouched.
+    """
+    # tutti i worker condividono il loop: le query ORM girano nel suo executor,
+    # così un round trip al DB non ferma gli altri insight, gli heartbeat e l'OCR
+    loop = asyncio.get_running_loop()
+    ins = await loop.run_in_executor(None, _load, session, insight_id)
     if not ins:
         logger.warning(f"Insight {insight_id} not found")
         return
+    if ins["extracted"] is not None:
+        # job riconsegnato (lease perso, crash tra commit e rilascio del job): ins.text
+        # contiene già trascrizione e OCR, rielaborarlo li duplicherebbe e li ripagherebbe
+        logger.info(f"Insight {insight_id} already processed, skipping")
+        return
     
     try:
         # Collect text sources
         text_sources = []
-        if ins.text:
-            text_sources.append(ins.text)
+        if ins["text"]:
+            text_sources.append(ins["text"])
         
-        # Process audio with real Whisper
-        if ins.audio_url:
+        # Media stages (Whisper, OCR) are independent: run them concurrently.
+        # gather() keeps results in submission order, so the merge order stays
+        # text -> transcription -> OCR regardless of which stage finishes first.
+        stages = []
+        if ins["audio_url"]:
             logger.info(f"Transcribing audio for insight {insight_id}")
-            transcription = await transcribe_audio_real(ins.audio_url)
-            if transcription:
-                text_sources.append(transcription)
+            stages.append(("audio", transcribe_audio_real(ins["audio_url"])))
+        if ins["photo_url"]:
+            logger.info(f"Processing OCR for insight {insight_id}")
+            stages.append(("ocr", ocr_image_real(ins["photo_url"])))
+        
+        results = await _run_media_stages([coro for _, coro in stages])
         
-        # Process image with real OCR
         ocr_text = None
-        if ins.photo_url:
-            logger.info(f"Processing OCR for insight {insight_id}")
-            ocr_text = await ocr_image_real(ins.photo_url)
-            if ocr_text:
-                text_sources.append(ocr_text)
+        for (kind, _), result in zip(stages, results):
+            if kind == "ocr":
+                ocr_text = result
+            if result:
+                text_sources.append(result)
         
         # Merge all text sources
         merged_text = "\n".join([t for t in text_sources if t and t.strip()]) or None
@@ -75,41 +173,40 @@ async def process_insight_async(session: Session, insight_id: str) -> None:
         # Anonymize for privacy
         anon_text = anonymize_text(merged_text) if merged_text else None
         
-        # Advanced sentiment analysis
-        extracted = analyze_sentiment_advanced(anon_text) if anon_text else {"sentiment": "neutral"}
+        # Advanced sentiment analysis (tier thresholds can be overridden per tenant)
+        if anon_text:
+            tier = sentiment_tier_config(ins["ai_config"])
+            extracted = await analyze_sentiment_advanced_async(anon_text, tier=tier)
+        else:
+            extracted = {"sentiment": "neutral"}
         
         # Update insight with processed data
-        ins.text = anon_text
-        ins.ocr_text = ocr_text or ins.ocr_text
-        ins.extracted = extracted
-        
-        session.add(ins)
-        session.commit()
+        await loop.run_in_executor(
+            None, functools.partial(
+                _save, session, insight_id,
+                text=anon_text, ocr_text=ocr_text or ins["ocr_text"], extracted=extracted,
+            )
+        )
         
         logger.info(f"Successfully processed insight {insight_id}")
         
     except Exception as e:
         logger.error(f"Failed to process insight {insight_id}: {e}")
-        # Set error status in extracted field
-        ins.extracted = {"sentiment": "neutral", "error": str(e)}
-        session.add(ins)
-        session.commit()
+        await loop.run_in_executor(None, session.rollback)
+        if final_attempt:
+            # Set error status in extracted field: no retry left
+            await loop.run_in_executor(
+                None, functools.partial(_save, session, insight_id, extracted={"sentiment": "neutral", "error": str(e)})
+            )
+        raise
 
 
 def process_insight(session: Session, insight_id: str) -> None:
     """Synchronous wrapper for async processing"""
     try:
-        # Run async processing in event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(process_insight_async(session, insight_id))
+        run_on_worker_loop(process_insight_async(session, insight_id))
     except Exception as e:
         logger.error(f"Error in sync processing wrapper: {e}")
-    finally:
-        try:
-            loop.close()
-        except:
-            pass
 
 
 # Backward compatibility
@@ -119,18 +216,10 @@ def transcribe_audio_stub(audio_url: Optional[str]) -> Optional[str]:
         return None
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(transcribe_audio_real(audio_url))
-        return result
+        return run_on_worker_loop(transcribe_audio_real(audio_url))
     except Exception as e:
         logger.error(f"Transcription error: {e}")
         return f"[Errore trascrizione: {str(e)}]"
-    finally:
-        try:
-            loop.close()
-        except:
-            pass
 
 
 def ocr_image_stub(photo_url: Optional[str]) -> Optional[str]:
@@ -139,18 +228,10 @@ def ocr_image_stub(photo_url: Optional[str]) -> Optional[str]:
         return None
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(ocr_image_real(photo_url))
-        return result
+        return run_on_worker_loop(ocr_image_real(photo_url))
     except Exception as e:
         logger.error(f"OCR error: {e}")
         return f"[Errore OCR: {str(e)}]"
-    finally:
-        try:
-            loop.close()
-        except:
-            pass
 
 
 def basic_extraction(text: Optional[str]) -> Dict[str, Any]:
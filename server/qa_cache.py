@@ -0,0 +1,195 @@
+"""
+Semantic answer cache for /qa, scoped per tenant and product line.
+
+A question is answered from cache when it matches a previous one exactly (after
+normalization) or when its embedding has cosine similarity >= QA_CACHE_SIMILARITY
+with a cached question in the same scope. Entries are bounded by LRU and TTL.
+
+Invalidation is versioned: index_report_for_rag bumps the qa_index_version rows of
+every scope the new report can appear in, and entries cached under an older version
+are dropped on lookup. The version lives in the database, so a report indexed by
+the weekly job invalidates the caches of every API replica.
+"""
+
+import math
+import operator
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional, Any, Dict, List, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from .config import settings
+from .db import SessionLocal
+from .models import QAIndexVersion
+
+logger = logging.getLogger(__name__)
+
+_VERSION_TTL_SECONDS = 1.0
+
+
+def qa_scope(tenant_id: Optional[str], product_line_id: Optional[str]) -> str:
+    return f"{tenant_id or '*'}|{product_line_id or '*'}"
+
+
+def _affected_scopes(tenant_id: Optional[str], product_line_id: Optional[str]) -> List[str]:
+    """Scopes whose answers can cite a report of (tenant, product line)"""
+    scopes = {qa_scope(t, p) for t in (tenant_id, None) for p in (product_line_id, None)}
+    return sorted(scopes)
+
+
+def _normalize_query(text: str) -> str:
+    return " ".join(text.split()).casefold().rstrip("?!. ")
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float, ttl_seconds: int, max_items: int, max_items_per_scope: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.max_items_per_scope = max_items_per_scope
+        # (scope, normalized query) -> (version, expires_monotonic, unit embedding, answer), LRU order
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, float, Optional[List[float]], Any]]" = OrderedDict()
+        self._scopes: Dict[str, "OrderedDict[str, None]"] = {}
+        self._versions: Dict[str, Tuple[float, int]] = {}  # scope -> (checked_at, version)
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "invalidated": 0}
+
+    # --- index versions (blocking: call from a thread) ---
+
+    def version(self, scope: str) -> int:
+        with self._lock:
+            cached = self._versions.get(scope)
+            if cached and time.monotonic() - cached[0] < _VERSION_TTL_SECONDS:
+                return cached[1]
+        session = SessionLocal()
+        try:
+            row = session.get(QAIndexVersion, scope)
+            value = row.version if row else 0
+        except Exception as e:
+            logger.warning(f"QA index version lookup failed: {e}")
+            value = -1  # nothing cached under -1 is ever served after the DB comes back
+        finally:
+            session.close()
+        with self._lock:
+            self._versions[scope] = (time.monotonic(), value)
+        return value
+
+    def invalidate(self, tenant_id: Optional[str], product_line_id: Optional[str]) -> None:
+        """Bump the index version of every scope a new report of (tenant, product line) affects"""
+        scopes = _affected_scopes(tenant_id, product_line_id)
+        for attempt in range(2):
+            session = SessionLocal()
+            try:
+                for scope in scopes:
+                    row = session.get(QAIndexVersion, scope)
+                    if row is None:
+                        session.add(QAIndexVersion(scope=scope, version=1))
+                    else:
+                        row.version += 1
+                session.commit()
+                break
+            except IntegrityError:
+                # another process created the row concurrently: retry as an update
+                session.rollback()
+            finally:
+                session.close()
+        with self._lock:
+            for scope in scopes:
+                self._versions.pop(scope, None)
+                for query in list(self._scopes.pop(scope, {})):
+                    self._entries.pop((scope, query), None)
+                    self.stats["invalidated"] += 1
+
+    # --- entries (never block) ---
+
+    def _drop(self, scope: str, query: str) -> None:
+        self._entries.pop((scope, query), None)
+        keys = self._scopes.get(scope)
+        if keys is not None:
+            keys.pop(query, None)
+            if not keys:
+                del self._scopes[scope]
+
+    def _live(self, scope: str, query: str, version: int, now: float):
+        entry = self._entries.get((scope, query))
+        if entry is None:
+            return None
+        if entry[0] != version or entry[1] < now:
+            self._drop(scope, query)
+            return None
+        return entry
+
+    def get_exact(self, scope: str, version: int, query: str) -> Optional[Any]:
+        normalized = _normalize_query(query)
+        with self._lock:
+            entry = self._live(scope, normalized, version, time.monotonic())
+            if entry is None:
+                return None
+            self._entries.move_to_end((scope, normalized))
+            self._scopes[scope].move_to_end(normalized)
+            self.stats["exact_hits"] += 1
+            return entry[3]
+
+    def get_similar(self, scope: str, version: int, embedding: List[float]) -> Optional[Any]:
+        """Best cached answer in the scope with cosine similarity >= threshold"""
+        probe = _unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            best, best_score = None, self.threshold
+            for query in list(self._scopes.get(scope, ())):
+                entry = self._live(scope, query, version, now)
+                if entry is None or entry[2] is None:
+                    continue
+                score = sum(map(operator.mul, probe, entry[2]))
+                if score >= best_score:
+                    best, best_score = query, score
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end((scope, best))
+            self._scopes[scope].move_to_end(best)
+            self.stats["semantic_hits"] += 1
+            return self._entries[(scope, best)][3]
+
+    def put(self, scope: str, version: int, query: str, embedding: Optional[List[float]], answer: Any) -> None:
+        normalized = _normalize_query(query)
+        vector = _unit(embedding) if embedding else None
+        with self._lock:
+            self._entries[(scope, normalized)] = (version, time.monotonic() + self.ttl_seconds, vector, answer)
+            self._entries.move_to_end((scope, normalized))
+            keys = self._scopes.setdefault(scope, OrderedDict())
+            keys[normalized] = None
+            keys.move_to_end(normalized)
+            while len(keys) > self.max_items_per_scope:
+                oldest = next(iter(keys))
+                self._drop(scope, oldest)
+            while len(self._entries) > self.max_items:
+                oldest_scope, oldest = next(iter(self._entries))
+                self._drop(oldest_scope, oldest)
+            self.stats["stores"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, items=len(self._entries), scopes=len(self._scopes), threshold=self.threshold)
+
+
+qa_cache: Optional[SemanticAnswerCache] = (
+    SemanticAnswerCache(
+        settings.QA_CACHE_SIMILARITY,
+        settings.QA_CACHE_TTL_SECONDS,
+        settings.QA_CACHE_MAX_ITEMS,
+        settings.QA_CACHE_MAX_ITEMS_PER_SCOPE,
+    )
+    if settings.QA_CACHE_ENABLED else None
+)
+
+
+def get_qa_cache_stats() -> Dict[str, Any]:
+    return qa_cache.get_stats() if qa_cache else {"enabled": False}
@@ -0,0 +1,202 @@
+"""
+Client-side rate governor for OpenAI: requests-per-minute and tokens-per-minute
+token buckets shared by every call in the process, plus jittered exponential
+backoff on 429/5xx so throughput sits just under the account limits.
+
+Buckets are guarded by a threading lock and waits are plain sleeps, so the same
+governor serves the API loop, the processing loop and blocking SDK threads.
+With several replicas, set the limits to each replica's share of the account.
+"""
+
+import asyncio
+import random
+import threading
+import time
+import logging
+from typing import Optional, Callable, Awaitable, Any, Dict, TypeVar
+
+import openai
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Refills continuously at capacity/60 per second; reservations may go into debt"""
+
+    def __init__(self, capacity_per_minute: int):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount now and return how long the caller must wait for it to be covered"""
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(e, openai.APIStatusError) and e.status_code >= 500
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class RateGovernor:
+    def __init__(self, rpm: int, tpm: int, max_retries: int, backoff_base: float, backoff_max: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "throttled": 0,
+            "wait_s_total": 0.0,
+            "wait_s_max": 0.0,
+            "retries": 0,
+            "rate_limited": 0,
+            "server_errors": 0,
+            "failed": 0,
+        }
+
+    def _reserve(self, est_tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.reserve(1, now), self.tokens.reserve(est_tokens, now))
+            self.stats["calls"] += 1
+            if wait > 0:
+                self.stats["throttled"] += 1
+                self.stats["wait_s_total"] = round(self.stats["wait_s_total"] + wait, 3)
+                self.stats["wait_s_max"] = round(max(self.stats["wait_s_max"], wait), 3)
+            return wait
+
+    def _refund(self, est_tokens: int) -> None:
+        """Give back a reservation whose request failed retryably: the retry reserves again"""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refund(1, now)
+            self.tokens.refund(min(est_tokens, self.tokens.capacity), now)
+
+    def settle(self, est_tokens: int, response: Any) -> None:
+        """Correct the token bucket with the usage the API actually reported"""
+        usage = getattr(response, "usage", None)
+        actual = getattr(usage, "total_tokens", None) if usage is not None else None
+        if actual is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if actual < est_tokens:
+                self.tokens.refund(est_tokens - actual, now)
+            elif actual > est_tokens:
+                self.tokens.reserve(actual - est_tokens, now)
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        with self._lock:
+            self.stats["retries"] += 1
+            if isinstance(e, openai.RateLimitError):
+                self.stats["rate_limited"] += 1
+            elif isinstance(e, openai.APIStatusError):
+                self.stats["server_errors"] += 1
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay *= random.uniform(0.5, 1.5)  # jitter: retries from many workers do not line up
+        return max(delay, _retry_after(e) or 0.0)
+
+    async def acquire(self, est_tokens: int = 0) -> float:
+        wait = self._reserve(est_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    async def call(self, fn: Callable[[], Awaitable[T]], est_tokens: int = 0) -> T:
+        """Await fn() under the limits, retrying 429/5xx/timeouts with jittered backoff"""
+        attempt = 0
+        while True:
+            await self.acquire(est_tokens)
+            try:
+                response = await fn()
+            except Exception as e:
+                if not _is_retryable(e):
+                    with self._lock:
+                        self.stats["failed"] += 1
+                    raise
+                self._refund(est_tokens)
+                if attempt >= self.max_retries:
+                    with self._lock:
+                        self.stats["failed"] += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(f"OpenAI call failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.settle(est_tokens, response)
+            return response
+
+    def call_blocking(self, fn: Callable[[], T], est_tokens: int = 0) -> T:
+        """Synchronous counterpart of call() for the sync client and worker threads"""
+        attempt = 0
+        while True:
+            wait = self._reserve(est_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                response = fn()
+            except Exception as e:
+                if not _is_retryable(e):
+                    with self._lock:
+                        self.stats["failed"] += 1
+                    raise
+                self._refund(est_tokens)
+                if attempt >= self.max_retries:
+                    with self._lock:
+                        self.stats["failed"] += 1
+                    raise
+                time.sleep(self._backoff(attempt, e))
+                attempt += 1
+                continue
+            self.settle(est_tokens, response)
+            return response
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["wait_s_avg"] = round(stats["wait_s_total"] / stats["throttled"], 3) if stats["throttled"] else 0.0
+            stats["rpmLimit"] = int(self.requests.capacity)
+            stats["tpmLimit"] = int(self.tokens.capacity)
+        return stats
+
+
+governor = RateGovernor(
+    rpm=settings.OPENAI_RPM_LIMIT,
+    tpm=settings.OPENAI_TPM_LIMIT,
+    max_retries=settings.OPENAI_MAX_RETRIES,
+    backoff_base=settings.OPENAI_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.OPENAI_BACKOFF_MAX_SECONDS,
+)
+
+
+def get_governor_stats() -> Dict[str, Any]:
+    return governor.get_stats()
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from db import get_session
 from models import Tenant, User, UserTenantRole, LoginAccount, InsightRaw
 from deps import require_role
+from schemas import TenantAIConfig
 from hashlib import sha256
 from datetime import datetime
 from jobs.weekly_report_job import run_weekly
@@ -31,6 +32,17 @@ def create_tenant(body: dict, session: Session = Depends(get_session), user=Depe
     return {"id": t.id, "name": t.name, "companyCode": t.company_code}
 
 
+@router.put("/admin/tenants/{tenant_id}/ai-config")
+def update_tenant_ai_config(tenant_id: str, body: TenantAIConfig, session: Session = Depends(get_session), user=Depends(require_role("super_admin"))):
+    # Es. {"sentimentTier": {"enabled": true, "minConfidence": 0.6, "maxChars": 200}}
+    t = session.get(Tenant, tenant_id)
+    if not t:
+        raise HTTPException(status_code=404, detail="tenant not found")
+    t.ai_config = body.model_dump(exclude_none=True)
+    session.commit()
+    return {"id": t.id, "aiConfig": t.ai_config}
+
+
 @router.post("/admin/users", status_code=201)
 def create_user(body: dict, session: Session = Depends(get_session), user=Depends(require_role("super_admin", "admin"))):
     # Integrazione con IdP esterno non gestita qui: si registra solo nel DB interno
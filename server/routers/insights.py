@@ -1,26 +1,34 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from schemas import InsightCreate
-from models import InsightRaw
+from pydantic import ValidationError
+from schemas import InsightCreate, InsightBatchCreate
+from models import InsightRaw, uuid_str
 from db import get_session
 from deps import get_current_user
 from fastapi import Header, Depends
 from deps import resolve_tenant_id
 from sqlalchemy import select
-from processing_queue import enqueue_insight
+from processing_queue import (
+    enqueue_insight,
+    enqueue_insights,
+    lane_for,
+    backlog_depth,
+    estimate_wait_seconds,
+    retry_after_seconds,
+    job_status,
+)
+from config import settings
+import idempotency
 
 
 router = APIRouter(tags=["insights"])
 
 
-@router.post("/insights", status_code=201)
-def create_insight(
-    body: InsightCreate,
-    session: Session = Depends(get_session),
-    user=Depends(get_current_user),
-    tenant_id: str | None = Depends(resolve_tenant_id),
-):
-    item = InsightRaw(
+def _new_insight(body: InsightCreate, tenant_id: str | None) -> InsightRaw:
+    return InsightRaw(
+        id=uuid_str(),
         tenant_id=tenant_id,
         product_line_id=body.productLineId,
         territory_id=body.territoryId,
@@ -30,11 +38,160 @@ def create_insight(
         photo_url=body.photoUrl,
         ocr_text=body.ocrText,
     )
+
+
+def _reject_if_backlog_full(incoming: int = 1):
+    # Admission control: oltre il limite il backlog non cresce, il client riprova più tardi
+    if backlog_depth() + incoming > settings.PROCESSING_BACKLOG_MAX:
+        raise HTTPException(
+            status_code=503,
+            detail="processing backlog full",
+            headers={"Retry-After": str(retry_after_seconds())},
+        )
+
+
+def _check_idempotency_key(key: str | None):
+    if key is not None and not 0 < len(key) <= idempotency.MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key must be 1-{idempotency.MAX_KEY_LENGTH} characters",
+        )
+
+
+def _replay(session: Session, scope: str, key: str, fingerprint: str) -> JSONResponse | None:
+    """Risposta originale per una chiave già vista, senza toccare insight né coda"""
+    record = idempotency.lookup(session, scope, key)
+    if record is None:
+        return None
+    if record.fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key already used for a different request")
+    return JSONResponse(record.response, status_code=record.status_code, headers={"Idempotent-Replayed": "true"})
+
+
+def _commit_idempotent(session: Session, scope: str, key: str | None, fingerprint: str | None,
+                       response: dict, status_code: int = 202):
+    """Commit di insight, job e record della chiave in un'unica transazione. Se una richiesta
+    concorrente con la stessa chiave ha già fatto commit, la nostra viene annullata per intero
+    e si restituisce la sua risposta."""
+    if key is None:
+        session.commit()
+        return response
+    idempotency.remember(session, scope, key, fingerprint, status_code, response)
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        replay = _replay(session, scope, key, fingerprint)
+        if replay is None:
+            raise
+        return replay
+    return response
+
+
+@router.post("/insights", status_code=202)
+def create_insight(
+    body: InsightCreate,
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user),
+    tenant_id: str | None = Depends(resolve_tenant_id),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
+    _check_idempotency_key(idempotency_key)
+    scope = idempotency.scope_for(tenant_id, user["userId"])
+    fingerprint = None
+    if idempotency_key is not None:
+        fingerprint = idempotency.fingerprint("POST /insights", body.model_dump())
+        replay = _replay(session, scope, idempotency_key, fingerprint)
+        if replay is not None:
+            return replay
+    _reject_if_backlog_full()
+    item = _new_insight(body, tenant_id)
     session.add(item)
-    session.commit()
-    # Enqueue per processing asincrono leggero
-    enqueue_insight(item.id)
-    return {"id": item.id, "status": "queued"}
+    session.flush()
+    # Job di processing nella stessa transazione: nessun insight perso se il processo muore
+    lane = lane_for(item.audio_url, item.photo_url)
+    enqueue_insight(item.id, session=session, priority=lane, tenant_id=tenant_id)
+    response = {
+        "id": item.id,
+        "status": "queued",
+        "estimatedCompletionSeconds": estimate_wait_seconds(lane),
+        "statusUrl": f"/v1/insights/{item.id}/status",
+    }
+    return _commit_idempotent(session, scope, idempotency_key, fingerprint, response)
+
+
+@router.post("/insights:batch", status_code=202)
+def create_insights_batch(
+    body: InsightBatchCreate,
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user),
+    tenant_id: str | None = Depends(resolve_tenant_id),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
+    """Replay di insight raccolti offline: un solo INSERT e un solo enqueue per tutto il batch.
+    Gli item non validi sono riportati per indice senza bloccare gli altri."""
+    if len(body.items) > settings.INSIGHTS_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"max {settings.INSIGHTS_BATCH_MAX_ITEMS} items per batch",
+        )
+    _check_idempotency_key(idempotency_key)
+    scope = idempotency.scope_for(tenant_id, user["userId"])
+    fingerprint = None
+    if idempotency_key is not None:
+        fingerprint = idempotency.fingerprint("POST /insights:batch", body.model_dump())
+        replay = _replay(session, scope, idempotency_key, fingerprint)
+        if replay is not None:
+            return replay
+    results = []
+    items = []
+    for index, raw in enumerate(body.items):
+        try:
+            item = _new_insight(InsightCreate.model_validate(raw), tenant_id)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            results.append({"index": index, "status": "rejected", "error": errors})
+            continue
+        items.append(item)
+        results.append({"index": index, "id": item.id, "status": "queued"})
+    if items:
+        # nessun item valido: niente da accodare, il 202 riporta solo gli scarti
+        _reject_if_backlog_full(len(items))
+        session.add_all(items)
+        session.flush()
+        enqueue_insights(session, [
+            (item.id, tenant_id, lane_for(item.audio_url, item.photo_url)) for item in items
+        ])
+    slowest = max((lane_for(i.audio_url, i.photo_url) for i in items), default=0)
+    response = {
+        "accepted": len(items),
+        "rejected": len(results) - len(items),
+        "estimatedCompletionSeconds": estimate_wait_seconds(slowest) if items else None,
+        "items": results,
+    }
+    return _commit_idempotent(session, scope, idempotency_key, fingerprint, response)
+
+
+@router.get("/insights/{insight_id}/status")
+def get_insight_status(
+    insight_id: str,
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user),
+    tenant_id: str | None = Depends(resolve_tenant_id),
+):
+    item = session.get(InsightRaw, insight_id)
+    if not item or (tenant_id and item.tenant_id != tenant_id):
+        raise HTTPException(status_code=404, detail="insight not found")
+    job = job_status(insight_id)
+    if job is None:
+        # insight precedenti alla coda persistente: l'unico stato è il risultato
+        job = {"status": "done" if item.extracted is not None else "unknown"}
+    return {
+        "id": item.id,
+        **job,
+        "processed": item.extracted is not None,
+        "extracted": item.extracted,
+    }
 
 
 @router.get('/insights')
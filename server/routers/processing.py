@@ -1,9 +1,26 @@
 from fastapi import APIRouter
+from processing_queue import get_worker_stats
+from ocr_engine import get_ocr_stats
+from media_cache import get_media_cache_stats
+from ai_services import get_sentiment_stats, get_route_stats, get_embedding_stats
+from ai_cache import get_ai_cache_stats
+from qa_cache import get_qa_cache_stats
+from rate_governor import get_governor_stats
 
 router = APIRouter(tags=["processing"])
 
-# Placeholder per health/status pipeline (futuro: coda, worker, metrics)
+
 @router.get('/processing/health')
 def processing_health():
-    return {"pipeline": "ok"}
-
+    return {
+        "pipeline": "ok",
+        "pool": get_worker_stats(),
+        "ocr": get_ocr_stats(),
+        "mediaCache": get_media_cache_stats(),
+        "sentiment": get_sentiment_stats(),
+        "aiCache": get_ai_cache_stats(),
+        "qaCache": get_qa_cache_stats(),
+        "embeddings": get_embedding_stats(),
+        "openaiGovernor": get_governor_stats(),
+        "openaiRoutes": get_route_stats(),
+    }
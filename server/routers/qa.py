@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
 from db import get_session
@@ -6,8 +7,10 @@ from models import WeeklyReport
 from schemas import QARequest, QAResponse, QACitation
 from deps import get_current_user, resolve_tenant_id, rate_limit
 from config import settings
-from ai_services import qa_with_rag
+from ai_services import qa_with_rag, qa_with_rag_stream
 import asyncio
+import contextlib
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -111,3 +114,37 @@ async def qa(body: QARequest, session: Session = Depends(get_session), user=Depe
     
     return QAResponse(answer=answer, citations=citations)
 
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/qa/stream")
+async def qa_stream(body: QARequest, user=Depends(get_current_user), tenant_id: str | None = Depends(resolve_tenant_id), _rl=Depends(rate_limit(settings.RATE_LIMIT_QA_PER_MIN))):
+    """
+    Q&A over Server-Sent Events: citations as soon as retrieval finishes, then answer tokens.
+    Events: citations, token (one per delta), done, error.
+    """
+    async def events():
+        if not (settings.ENABLE_AI_PROCESSING and settings.OPENAI_API_KEY):
+            yield _sse("error", {"error": "AI Q&A not configured, use /v1/qa"})
+            return
+        # chiuso esplicitamente alla disconnessione del client: chiude anche lo stream OpenAI
+        async with contextlib.aclosing(qa_with_rag_stream(
+            query=body.query,
+            product_line_id=body.productLineId,
+            tenant_id=tenant_id
+        )) as items:
+            async for item in items:
+                if item["event"] == "citations":
+                    item["data"] = [
+                        QACitation(reportId=c["reportId"], section=c["section"], weekId=c["weekId"]).model_dump()
+                        for c in item["data"]
+                    ]
+                yield _sse(item["event"], item["data"])
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, StrictBool
 from typing import Optional, List, Dict, Any
 
 
@@ -12,6 +12,11 @@ class InsightCreate(BaseModel):
     ocrText: Optional[str] = None
 
 
+class InsightBatchCreate(BaseModel):
+    # item validati uno per uno: un item non valido non fa fallire tutto il batch
+    items: List[Dict[str, Any]]
+
+
 class UploadPresignResponse(BaseModel):
     url: str
     fields: Dict[str, Any]
@@ -49,3 +54,16 @@ class QAResponse(BaseModel):
     citations: List[QACitation]
 
 
+
+
+class SentimentTierConfig(BaseModel):
+    # campi assenti = default globali (SENTIMENT_TIER_*)
+    model_config = ConfigDict(extra="forbid")
+    enabled: Optional[StrictBool] = None
+    minConfidence: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    maxChars: Optional[int] = Field(default=None, ge=0, le=100000)
+
+
+class TenantAIConfig(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    sentimentTier: Optional[SentimentTierConfig] = None